@@ -0,0 +1,240 @@
+import numpy as np
+import pandas as pd
+from app.cache import memoized
+from app.ingest import append_rows
+from app.metrics import timed
+from app.statistics import seasonal_statistics
+
+
+__all__ = [
+    'CityAnalysis',
+    'analyze_cities',
+    'calculate_moving_average',
+    'calculate_rolling_quantiles',
+    'ROLLING_BANDS',
+    'detect_anomalies',
+    'analyze_city',
+    'seasonal_profile',
+    'group_bounds',
+    'split_groups',
+    'rolling_mean',
+    'rolling_std',
+    'rolling_quantile',
+    'group_anomalies',
+    'analyze_kernel',
+]
+
+
+@timed("rolling")
+def calculate_moving_average(data, window=30):
+    return data["temperature"].rolling(window=window, min_periods=1).mean()
+
+
+ROLLING_BANDS = (("rolling_q1", 0.25), ("rolling_median", 0.5), ("rolling_q3", 0.75))
+
+
+@timed("rolling")
+def calculate_rolling_quantiles(data, window=30, bands=ROLLING_BANDS):
+    """Скользящие медиана и квартили температуры; окно pandas держит значения в skip-list, O(n log w)."""
+    rolling = data["temperature"].rolling(window=window, min_periods=1)
+    return pd.DataFrame({name: rolling.quantile(q) for name, q in bands}, index=data.index)
+
+
+def detect_anomalies(data, std_dev_factor=2):
+    """Выявляет аномалии, где температура выходит за пределы среднее ± 2σ."""
+    values = data["temperature"].to_numpy(dtype=np.float64, na_value=np.nan)
+    data["is_anomaly"] = group_anomalies(values, np.array([0]), np.array([len(values)]), std_dev_factor)
+    return data
+
+
+@memoized("analyze_city", copy=True)
+def analyze_city(city_data):
+    """Анализирует данные для одного города."""
+    city_data = city_data.copy()
+    city_data["moving_avg"] = calculate_moving_average(city_data)
+    city_data = detect_anomalies(city_data)
+    return city_data
+
+
+def seasonal_profile(city_data):
+    """Сезонная статистика температуры: среднее, σ, медиана, квартили и число наблюдений."""
+    return seasonal_statistics(city_data, by=("season",))
+
+
+def group_bounds(codes):
+    """Возвращает стабильную перестановку, сортирующую строки по группам, и границы групп.
+
+    Строки с отрицательным кодом (пропуск в ключе группировки) в перестановку не попадают.
+    """
+    codes = np.asarray(codes)
+    known = np.flatnonzero(codes >= 0)
+    order = known[np.argsort(codes[known], kind="stable")]
+    counts = np.bincount(codes[known], minlength=codes.max() + 1 if len(codes) else 0)
+    ends = np.cumsum(counts)
+    starts = ends - counts
+    return order, starts, ends
+
+
+def split_groups(starts, ends, n_batches):
+    """Делит подряд идущие группы на пакеты примерно равного числа строк.
+
+    Возвращает список (lo, hi, starts, ends) с границами групп относительно lo.
+    """
+    n_rows = int(ends[-1]) if len(ends) else 0
+    if n_rows == 0:
+        return []
+    cuts = np.searchsorted(ends, np.linspace(0, n_rows, n_batches + 1)[1:-1], side="left") + 1
+    batches = []
+    for group_lo, group_hi in zip(np.concatenate(([0], cuts)), np.concatenate((cuts, [len(ends)]))):
+        if group_hi <= group_lo:
+            continue
+        lo, hi = int(starts[group_lo]), int(ends[group_hi - 1])
+        batches.append((lo, hi, starts[group_lo:group_hi] - lo, ends[group_lo:group_hi] - lo))
+    return batches
+
+
+def _row_starts(starts, ends, n):
+    group_start = np.zeros(n, dtype=np.int64)
+    nonempty = ends > starts
+    group_start[starts[nonempty]] = starts[nonempty]
+    return np.maximum.accumulate(group_start) if n else group_start
+
+
+@timed("rolling")
+def rolling_mean(values, starts, ends, window=30):
+    """Скользящее среднее (min_periods=1, пропуски игнорируются) для отсортированных по группам значений."""
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    valid = ~np.isnan(values)
+    csum = np.concatenate(([0.0], np.cumsum(np.where(valid, values, 0.0))))
+    ccount = np.concatenate(([0], np.cumsum(valid)))
+
+    positions = np.arange(n)
+    lower = np.maximum(_row_starts(starts, ends, n), positions - window + 1)
+    total = csum[positions + 1] - csum[lower]
+    count = ccount[positions + 1] - ccount[lower]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(count > 0, total / count, np.nan)
+
+
+@timed("rolling")
+def rolling_std(values, starts, ends, window=30):
+    """Скользящее стандартное отклонение (ddof=1) за O(n) по накопленным суммам; NaN, если в окне меньше двух значений.
+
+    Значения центрируются по среднему группы, чтобы разность накопленных сумм квадратов не теряла точность.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    valid = ~np.isnan(values)
+    group_ids = np.repeat(np.arange(len(starts)), ends - starts)
+    counts = np.bincount(group_ids, weights=valid, minlength=len(starts))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        centers = np.bincount(group_ids, weights=np.where(valid, values, 0.0), minlength=len(starts)) / counts
+    centered = np.where(valid, values - centers[group_ids], 0.0) if n else values
+    csum = np.concatenate(([0.0], np.cumsum(centered)))
+    csum2 = np.concatenate(([0.0], np.cumsum(centered ** 2)))
+    ccount = np.concatenate(([0], np.cumsum(valid)))
+
+    positions = np.arange(n)
+    lower = np.maximum(_row_starts(starts, ends, n), positions - window + 1)
+    total = csum[positions + 1] - csum[lower]
+    total2 = csum2[positions + 1] - csum2[lower]
+    count = ccount[positions + 1] - ccount[lower]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        variance = np.maximum(total2 - total ** 2 / count, 0.0) / (count - 1)
+    return np.where(count > 1, np.sqrt(variance), np.nan)
+
+
+@timed("rolling")
+def rolling_quantile(values, starts, ends, q, window=30):
+    """Скользящий квантиль (min_periods=1, линейная интерполяция, пропуски игнорируются) для отсортированных
+    по группам значений; каждая группа считается окном pandas на skip-list за O(n log w).
+    """
+    values = np.asarray(values, dtype=np.float64)
+    result = np.full(len(values), np.nan)
+    for start, end in zip(starts, ends):
+        result[start:end] = pd.Series(values[start:end]).rolling(window, min_periods=1).quantile(q).to_numpy()
+    return result
+
+
+@timed("anomalies")
+def group_anomalies(values, starts, ends, std_dev_factor=2):
+    """Флаги выхода за среднее ± k·σ группы для отсортированных по группам значений."""
+    values = np.asarray(values, dtype=np.float64)
+    lengths = ends - starts
+    group_ids = np.repeat(np.arange(len(starts)), lengths)
+    valid = ~np.isnan(values)
+    filled = np.where(valid, values, 0.0)
+
+    count = np.bincount(group_ids, weights=valid, minlength=len(starts))
+    total = np.bincount(group_ids, weights=filled, minlength=len(starts))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = total / count
+        deviations = np.where(valid, values - mean[group_ids], 0.0)
+        m2 = np.bincount(group_ids, weights=deviations ** 2, minlength=len(starts))
+        std = np.sqrt(m2 / (count - 1))
+
+    row_mean = mean[group_ids]
+    row_std = std[group_ids]
+    return (values < row_mean - std_dev_factor * row_std) | (values > row_mean + std_dev_factor * row_std)
+
+
+def analyze_kernel(values, starts, ends, window=30, std_dev_factor=2):
+    """Скользящее среднее и флаги аномалий для набора подряд идущих групп."""
+    return rolling_mean(values, starts, ends, window), group_anomalies(values, starts, ends, std_dev_factor)
+
+
+class CityAnalysis:
+    """Результат анализа всех городов: один отсортированный по городам фрейм и индекс город → срез.
+
+    После дозаписи строк (`append`) срез города может быть массивом позиций.
+    """
+
+    def __init__(self, frame, slices):
+        self.frame = frame
+        self.slices = slices
+
+    @property
+    def cities(self):
+        return list(self.slices)
+
+    def city(self, city):
+        with timed("filter"):
+            return self.frame.iloc[self.slices[city]].copy()
+
+    def __iter__(self):
+        for city in self.slices:
+            yield self.city(city)
+
+    def __len__(self):
+        return len(self.slices)
+
+    def append(self, rows, positions):
+        """Новый результат с дописанными в конец строками; `positions` — позиции строк каждого города в `rows`."""
+        offset = len(self.frame)
+        slices = dict(self.slices)
+        for city, city_positions in positions.items():
+            new_positions = offset + np.asarray(city_positions, dtype=np.int64)
+            if city in slices:
+                old = slices[city]
+                old = np.arange(old.start, old.stop) if isinstance(old, slice) else old
+                new_positions = np.concatenate((old, new_positions))
+            slices[city] = new_positions
+        return CityAnalysis(append_rows(self.frame, rows), slices)
+
+
+def analyze_cities(df, window=30, std_dev_factor=2, kernel=analyze_kernel):
+    """Считает скользящее среднее и аномалии для всех городов за один проход без масок по городам.
+
+    `kernel(values, starts, ends, window, std_dev_factor)` позволяет подменить вычислитель,
+    например, на параллельный.
+    """
+    codes, cities = pd.factorize(df["city"])
+    order, starts, ends = group_bounds(codes)
+
+    frame = df.iloc[order].copy()
+    values = frame["temperature"].to_numpy(dtype=np.float64, na_value=np.nan)
+    frame["moving_avg"], frame["is_anomaly"] = kernel(values, starts, ends, window, std_dev_factor)
+
+    slices = {city: slice(int(start), int(end)) for city, start, end in zip(cities, starts, ends)}
+    return CityAnalysis(frame, slices)
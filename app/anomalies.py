@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+from app.analysis import group_anomalies, group_bounds, rolling_mean, rolling_quantile, rolling_std
+from app.cache import memoized
+from app.metrics import timed
+from app.statistics import grouped_quantiles, sorted_groups
+
+
+__all__ = ['METHODS', 'detect', 'flag_anomalies']
+
+
+METHODS = {
+    "rolling": "Скользящее окно: среднее ± kσ за последние дни",
+    "iqr": "Скользящие квартили: вне Q1 − 1.5·IQR … Q3 + 1.5·IQR",
+    "seasonal": "Сезонная норма: среднее ± kσ сезона",
+    "percentile": "Выше процентиля",
+    "global": "Среднее ± kσ за весь период",
+}
+
+
+def _percentile_anomalies(values, starts, ends, q):
+    group_ids = np.repeat(np.arange(len(starts)), ends - starts)
+    sorted_values, sorted_starts, sorted_ends = sorted_groups(values, group_ids, len(starts))
+    thresholds = grouped_quantiles(sorted_values, sorted_starts, sorted_ends, (q / 100,))[:, 0]
+    return values > thresholds[group_ids]
+
+
+def _seasonal_anomalies(values, starts, ends, seasons, std_dev_factor):
+    group_ids = np.repeat(np.arange(len(starts)), ends - starts)
+    n_seasons = int(seasons.max()) + 1 if len(seasons) else 0
+    keys = np.where(seasons >= 0, group_ids * n_seasons + seasons, -1)
+    order, key_starts, key_ends = group_bounds(keys)
+    flags = np.zeros(len(values), dtype=bool)
+    flags[order] = group_anomalies(values[order], key_starts, key_ends, std_dev_factor)
+    return flags
+
+
+@timed("anomalies")
+def detect(values, starts, ends, method="rolling", window=30, std_dev_factor=2, q=90, seasons=None):
+    """Флаги аномалий для отсортированных по городам значений, все города за один проход.
+
+    - `rolling`: отклонение от скользящего среднего больше `std_dev_factor` скользящих σ за `window` дней;
+    - `iqr`: выход за скользящие квартили дальше полутора межквартильных размахов — устойчиво к выбросам в окне;
+    - `seasonal`: выход за среднее ± kσ своего сезона (`seasons` — коды сезона для каждой строки);
+    - `percentile`: температура выше `q`-го процентиля города;
+    - `global`: выход за среднее ± kσ города за весь период.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if method == "rolling":
+        mean = rolling_mean(values, starts, ends, window)
+        std = rolling_std(values, starts, ends, window)
+        return np.abs(values - mean) > std_dev_factor * std
+    if method == "iqr":
+        q1 = rolling_quantile(values, starts, ends, 0.25, window)
+        q3 = rolling_quantile(values, starts, ends, 0.75, window)
+        return (values < q1 - 1.5 * (q3 - q1)) | (values > q3 + 1.5 * (q3 - q1))
+    if method == "seasonal":
+        return _seasonal_anomalies(values, starts, ends, np.asarray(seasons), std_dev_factor)
+    if method == "percentile":
+        return _percentile_anomalies(values, starts, ends, q)
+    if method == "global":
+        return group_anomalies(values, starts, ends, std_dev_factor)
+    raise ValueError(f"Неизвестный метод выявления аномалий: {method}")
+
+
+@memoized("flag_anomalies")
+def flag_anomalies(df, method="rolling", window=30, std_dev_factor=2, q=90):
+    """Флаги аномалий для строк фрейма в его исходном порядке (Series с индексом `df`)."""
+    codes, _ = pd.factorize(df["city"])
+    order, starts, ends = group_bounds(codes)
+    values = df["temperature"].to_numpy(dtype=np.float64, na_value=np.nan)[order]
+    seasons = pd.factorize(df["season"])[0][order] if method == "seasonal" else None
+
+    flags = np.zeros(len(df), dtype=bool)
+    flags[order] = detect(values, starts, ends, method, window, std_dev_factor, q, seasons)
+    return pd.Series(flags, index=df.index, name="is_anomaly")
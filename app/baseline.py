@@ -0,0 +1,113 @@
+import numpy as np
+import pandas as pd
+from app.cache import memoized
+from app.metrics import timed
+from app.statistics import seasonal_statistics
+
+
+__all__ = ['SeasonalBaseline', 'seasonal_baseline', 'STATS']
+
+
+STATS = ("mean", "std", "q1", "q3")
+
+
+class SeasonalBaseline:
+    """Индекс исторической нормы: статистики (город, сезон) в плотном массиве и климатология по дням года.
+
+    `stats` имеет форму (города, сезоны, STATS), `climatology` — (города, 366) со средней температурой
+    для каждого дня года. Проверка текущей температуры сводится к поиску в словаре и чтению из массива.
+    """
+
+    def __init__(self, cities, seasons, stats, climatology=None):
+        self.cities = list(cities)
+        self.seasons = list(seasons)
+        self.stats = stats
+        self.climatology = climatology
+        self._city_positions = {city: position for position, city in enumerate(self.cities)}
+        self._season_positions = {season: position for position, season in enumerate(self.seasons)}
+
+    @classmethod
+    def from_summary(cls, summary, climatology=None):
+        """Строит индекс из таблицы с колонками city, season и STATS."""
+        cities = pd.unique(summary["city"])
+        seasons = pd.unique(summary["season"])
+        table = summary.set_index(["city", "season"])[list(STATS)]
+        full_index = pd.MultiIndex.from_product([cities, seasons])
+        stats = table.reindex(full_index).to_numpy(dtype=np.float32).reshape(len(cities), len(seasons), len(STATS))
+        return cls(cities, seasons, stats, climatology)
+
+    @classmethod
+    def from_frame(cls, df, with_climatology=True):
+        baseline = cls.from_summary(seasonal_statistics(df))
+        if with_climatology and "timestamp" in df.columns:
+            baseline.climatology = day_of_year_climatology(df, baseline.cities)
+        return baseline
+
+    def lookup(self, city, season):
+        """Статистики нормы для пары (город, сезон) или None, если данных нет."""
+        city_position = self._city_positions.get(city)
+        season_position = self._season_positions.get(season)
+        if city_position is None or season_position is None:
+            return None
+        values = self.stats[city_position, season_position]
+        if np.isnan(values).all():
+            return None
+        return dict(zip(STATS, values.tolist()))
+
+    def is_normal(self, city, season, temperature):
+        stats = self.lookup(city, season)
+        if stats is None:
+            return None
+        return stats["q1"] <= temperature <= stats["q3"]
+
+    def day_normal(self, city, date):
+        """Климатическая средняя температура города для дня года даты `date`."""
+        if self.climatology is None or city not in self._city_positions:
+            return None
+        value = self.climatology[self._city_positions[city], int(_calendar_days(pd.DatetimeIndex([date]))[0])]
+        return None if np.isnan(value) else float(value)
+
+    def season_table(self, season, cities=None):
+        """Статистики всех (или указанных) городов для сезона в виде таблицы."""
+        cities = self.cities if cities is None else list(cities)
+        positions = np.array([self._city_positions.get(city, -1) for city in cities], dtype=np.int64)
+        values = np.full((len(cities), len(STATS)), np.nan, dtype=np.float32)
+        season_position = self._season_positions.get(season)
+        known = positions >= 0
+        if season_position is not None:
+            values[known] = self.stats[positions[known], season_position]
+        return pd.DataFrame(values, columns=list(STATS)).assign(city=cities)[["city", *STATS]]
+
+
+def _calendar_days(timestamps):
+    """Номер дня 0–365 по календарю високосного года: в обычные годы дни после 28 февраля сдвигаются на один,
+    чтобы одна и та же дата (например, 1 марта) всегда попадала в одну ячейку климатологии; NaN для NaT.
+    """
+    timestamps = pd.DatetimeIndex(timestamps)
+    shift = ~timestamps.is_leap_year & (timestamps.month > 2)
+    return np.asarray(timestamps.dayofyear, dtype=np.float64) - 1 + shift
+
+
+def day_of_year_sums(df, cities):
+    """Суммы и число наблюдений температуры по (город, день календаря), обе формы (города, 366)."""
+    codes = pd.Categorical(df["city"], categories=cities).codes.astype(np.int64)
+    days = _calendar_days(pd.to_datetime(df["timestamp"]))
+    temperature = df["temperature"].to_numpy(dtype=np.float64, na_value=np.nan)
+    valid = (codes >= 0) & ~np.isnan(temperature) & ~np.isnan(days)
+    cells = codes[valid] * 366 + days[valid].astype(np.int64)
+    size = len(cities) * 366
+    totals = np.bincount(cells, weights=temperature[valid], minlength=size)
+    counts = np.bincount(cells, minlength=size)
+    return totals.reshape(len(cities), 366), counts.reshape(len(cities), 366)
+
+
+@timed("groupby")
+def day_of_year_climatology(df, cities):
+    totals, counts = day_of_year_sums(df, cities)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return (totals / counts).astype(np.float32)
+
+
+@memoized("seasonal_baseline")
+def seasonal_baseline(df):
+    return SeasonalBaseline.from_frame(df)
@@ -0,0 +1,215 @@
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from functools import wraps
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from app.metrics import metrics
+
+
+__all__ = ['ResultCache', 'result_cache', 'fingerprint', 'remember_fingerprint', 'memoized', 'TTLCache']
+
+
+def _nbytes(value):
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return int(np.sum(value.memory_usage(deep=True)))
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (tuple, list)):
+        return sum(_nbytes(item) for item in value) + sys.getsizeof(value)
+    if hasattr(value, "to_plotly_json"):
+        return _nbytes(value.to_plotly_json())
+    if isinstance(value, dict):
+        return sum(_nbytes(item) for item in value.values()) + sys.getsizeof(value)
+    if hasattr(value, "__dict__"):
+        return sum(_nbytes(item) for item in vars(value).values()) + sys.getsizeof(value)
+    return sys.getsizeof(value)
+
+
+class ResultCache:
+    """LRU-кэш результатов вычислений с ограничением по занимаемой памяти."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.RLock()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def size(self):
+        return self._size
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key][0]
+
+    def put(self, key, value):
+        size = _nbytes(value)
+        with self._lock:
+            if key in self._entries:
+                self._size -= self._entries.pop(key)[1]
+            if size > self.max_bytes:
+                return value
+            self._entries[key] = (value, size)
+            self._size += size
+            while self._size > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+        return value
+
+    def get_or_compute(self, key, compute):
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return self._entries[key][0]
+            self.misses += 1
+        return self.put(key, compute())
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+
+result_cache = ResultCache(int(os.environ.get("RESULT_CACHE_MAX_BYTES", 512 * 2 ** 20)))
+metrics.gauge("result_cache_hits", lambda: result_cache.hits)
+metrics.gauge("result_cache_misses", lambda: result_cache.misses)
+metrics.gauge("result_cache_bytes", lambda: result_cache.size)
+
+_fingerprints = {}
+_fingerprints_lock = threading.Lock()
+
+
+def _forget(key):
+    with _fingerprints_lock:
+        _fingerprints.pop(key, None)
+
+
+def fingerprint(df):
+    """Хэш содержимого фрейма.
+
+    Для одного и того же объекта хэш считается один раз: загруженные данные считаются неизменяемыми,
+    повторный расчет выполняется только при изменении формы или набора столбцов.
+    """
+    shape = (df.shape, tuple(df.columns))
+    with _fingerprints_lock:
+        entry = _fingerprints.get(id(df))
+    if entry is not None and entry[0]() is df and entry[1] == shape:
+        return entry[2]
+
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr(shape).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return remember_fingerprint(df, digest.hexdigest())
+
+
+def remember_fingerprint(df, value):
+    """Запоминает уже известный хэш фрейма (например, сохраненный вместе с ним на диске), чтобы не считать его заново."""
+    key = id(df)
+    with _fingerprints_lock:
+        _fingerprints[key] = (weakref.ref(df, lambda _: _forget(key)), (df.shape, tuple(df.columns)), value)
+    return value
+
+
+def _key_part(value):
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return fingerprint(value if isinstance(value, pd.DataFrame) else value.to_frame())
+    return value
+
+
+def memoized(name, cache=result_cache, copy=False):
+    """Кэширует результат функции по отпечаткам переданных фреймов и значениям остальных аргументов.
+
+    При `copy=True` вызывающий код получает копию, чтобы изменения не портили кэш.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            key = (name,) + tuple(_key_part(arg) for arg in args) + tuple(
+                (param, _key_part(value)) for param, value in sorted(kwargs.items())
+            )
+            result = cache.get_or_compute(key, lambda: func(*args, **kwargs))
+            return result.copy() if copy else result
+        wrapper.uncached = func
+        return wrapper
+    return decorator
+
+
+class TTLCache:
+    """Кэш значений с временем жизни; при заданном `path` содержимое сохраняется в JSON-файл.
+
+    `set(..., persist=False)` только помечает кэш измененным: пакет значений записывается одним `flush()`.
+    """
+
+    def __init__(self, ttl, path=None, clock=time.time):
+        self.ttl = ttl
+        self.path = Path(path) if path else None
+        self.hits = 0
+        self.misses = 0
+        self._clock = clock
+        self._entries = {}
+        self._dirty = False
+        self._lock = threading.Lock()
+        if self.path is not None and self.path.exists():
+            try:
+                self._entries = {key: tuple(entry) for key, entry in json.loads(self.path.read_text()).items()}
+            except (OSError, ValueError):
+                self._entries = {}
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= self._clock():
+                self.misses += 1
+                return default
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, ttl=None, persist=True):
+        with self._lock:
+            self._entries[key] = (self._clock() + (self.ttl if ttl is None else ttl), value)
+            self._dirty = True
+            if persist and self.path is not None:
+                self._persist()
+
+    def flush(self):
+        """Записывает отложенные изменения в файл, если они есть."""
+        with self._lock:
+            if self._dirty and self.path is not None:
+                self._persist()
+
+    def _persist(self):
+        now = self._clock()
+        self._entries = {key: entry for key, entry in self._entries.items() if entry[0] > now}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        tmp_path.write_text(json.dumps(self._entries))
+        os.replace(tmp_path, self.path)
+        self._dirty = False
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self.path is not None:
+                self._persist()
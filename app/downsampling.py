@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+
+
+__all__ = ['DEFAULT_POINTS', 'lttb_indices', 'minmax_indices', 'downsample', 'downsample_groups', 'time_window']
+
+
+DEFAULT_POINTS = 1500
+
+
+def _numeric(values):
+    if pd.api.types.is_numeric_dtype(values):
+        return values.to_numpy(dtype=np.float64, na_value=np.nan)
+    timestamps = pd.to_datetime(values).to_numpy(dtype="datetime64[ns]")
+    return np.where(np.isnat(timestamps), np.nan, timestamps.astype(np.int64).astype(np.float64))
+
+
+def lttb_indices(x, y, n_out):
+    """Largest-Triangle-Three-Buckets: индексы `n_out` точек, сохраняющих форму ряда."""
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    anchor = 0
+    for bucket in range(n_out - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_end = edges[bucket + 2] if bucket + 2 < len(edges) else n
+        average_x = x[end:next_end].mean()
+        average_y = y[end:next_end].mean()
+        area = np.abs(
+            (x[anchor] - average_x) * (y[start:end] - y[anchor])
+            - (x[anchor] - x[start:end]) * (average_y - y[anchor])
+        )
+        anchor = start + int(np.argmax(area))
+        selected[bucket + 1] = anchor
+    return selected
+
+
+def minmax_indices(y, n_buckets):
+    """Индексы минимума и максимума в каждой из `n_buckets` равных корзин."""
+    n = len(y)
+    if 2 * n_buckets >= n:
+        return np.arange(n)
+    buckets = np.arange(n) * n_buckets // n
+    order = np.lexsort((y, buckets))
+    counts = np.bincount(buckets, minlength=n_buckets)
+    ends = np.cumsum(counts)
+    starts = ends - counts
+    return np.unique(np.concatenate((order[starts], order[ends - 1])))
+
+
+def downsample(data, x, y, n_points=DEFAULT_POINTS, method="lttb", keep=None):
+    """Прореживает ряд до `n_points` точек, всегда сохраняя глобальные экстремумы и строки из маски `keep`."""
+    if len(data) <= n_points:
+        return data
+    xs = _numeric(data[x])
+    if not np.all(np.diff(xs[~np.isnan(xs)]) >= 0):
+        order = np.argsort(xs, kind="stable")
+        data, xs = data.iloc[order], xs[order]
+        keep = None if keep is None else np.asarray(keep)[order]
+    ys = data[y].to_numpy(dtype=np.float64, na_value=np.nan)
+
+    positions = np.flatnonzero(~np.isnan(xs) & ~np.isnan(ys))
+    if len(positions) == 0:
+        return data.iloc[:0]
+    if method == "minmax":
+        chosen = minmax_indices(ys[positions], n_points // 2)
+    else:
+        chosen = lttb_indices(xs[positions], ys[positions], n_points)
+    extremes = [int(np.argmin(ys[positions])), int(np.argmax(ys[positions]))]
+    selected = [positions[chosen], positions[extremes]]
+    if keep is not None:
+        selected.append(np.flatnonzero(np.asarray(keep, dtype=bool)))
+    return data.iloc[np.unique(np.concatenate(selected))]
+
+
+def downsample_groups(data, by, x, y, n_points=DEFAULT_POINTS, method="lttb"):
+    """Прореживает каждый ряд группы (например, каждый город) независимо."""
+    parts = [
+        downsample(group, x, y, n_points, method)
+        for _, group in data.groupby(by, observed=True, sort=False)
+    ]
+    return pd.concat(parts) if parts else data
+
+
+def time_window(data, start, end, x="timestamp"):
+    """Строки в интервале [start, end] — окно, которое перерисовывается в полном разрешении при приближении."""
+    timestamps = pd.to_datetime(data[x])
+    return data[(timestamps >= pd.Timestamp(start)) & (timestamps <= pd.Timestamp(end))]
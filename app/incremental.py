@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+from app.analysis import analyze_cities, group_bounds, rolling_mean
+from app.baseline import SeasonalBaseline, day_of_year_sums
+from app.ingest import align_rows
+from app.streaming import StreamingAggregates
+
+
+__all__ = ['IncrementalAnalysis']
+
+
+class IncrementalAnalysis:
+    """Анализ набора данных, который пополняется новыми наблюдениями без пересчета истории.
+
+    Для каждого города хранятся последние `window - 1` значений (хвост скользящего окна), а моменты
+    по городам и по (город, сезон) обновляются слиянием Уэлфорда–Чана в `StreamingAggregates`.
+    Скользящее среднее и флаги аномалий считаются только для новых строк и совпадают с полным
+    пересчетом `analyze_cities`; флаги старых строк не пересматриваются. Суммы температур по дням календаря
+    тоже пополняются, так что сезонная норма `baseline` с климатологией строится без прохода по истории.
+    """
+
+    def __init__(self, analysis, aggregates, window=30, std_dev_factor=2):
+        self.analysis = analysis
+        self.aggregates = aggregates
+        self.window = window
+        self.std_dev_factor = std_dev_factor
+        temperature = analysis.frame["temperature"].to_numpy(dtype=np.float64, na_value=np.nan)
+        self._tails = {}
+        for city, rows in analysis.slices.items():
+            positions = np.arange(rows.start, rows.stop) if isinstance(rows, slice) else rows
+            self._tails[city] = temperature[positions[max(len(positions) - window + 1, 0):]]
+        self._day_cities = list(analysis.slices)
+        self._day_sums = None
+        if "timestamp" in analysis.frame.columns:
+            self._day_sums = day_of_year_sums(analysis.frame, self._day_cities)
+
+    @classmethod
+    def from_frame(cls, df, analysis=None, window=30, std_dev_factor=2):
+        """Строит состояние по загруженному набору; готовый результат `analyze_cities` можно передать в `analysis`."""
+        if analysis is None:
+            analysis = analyze_cities(df, window, std_dev_factor)
+        aggregates = StreamingAggregates()
+        aggregates.update(df)
+        return cls(analysis, aggregates, window, std_dev_factor)
+
+    @property
+    def frame(self):
+        return self.analysis.frame
+
+    @property
+    def baseline(self):
+        baseline = SeasonalBaseline.from_summary(self.aggregates.seasonal_summary())
+        if self._day_sums is not None:
+            positions = [self._day_cities.index(city) for city in baseline.cities]
+            totals, counts = self._day_sums
+            with np.errstate(invalid="ignore", divide="ignore"):
+                baseline.climatology = (totals[positions] / counts[positions]).astype(np.float32)
+        return baseline
+
+    def _update_day_sums(self, rows):
+        if self._day_sums is None:
+            return
+        new_cities = [city for city in pd.unique(rows["city"].dropna()) if city not in self._day_cities]
+        self._day_cities.extend(new_cities)
+        padding = ((0, len(new_cities)), (0, 0))
+        totals, counts = (np.pad(sums, padding) for sums in self._day_sums)
+        added_totals, added_counts = day_of_year_sums(rows, self._day_cities)
+        self._day_sums = totals + added_totals, counts + added_counts
+
+    def append(self, rows):
+        """Добавляет новые наблюдения и возвращает их со скользящим средним и флагами аномалий."""
+        _, rows = align_rows(self.frame, rows.assign(moving_avg=np.nan, is_anomaly=False))
+        self.aggregates.update(rows)
+        self._update_day_sums(rows)
+
+        codes, cities = pd.factorize(rows["city"])
+        order, starts, ends = group_bounds(codes)
+        values = rows["temperature"].to_numpy(dtype=np.float64, na_value=np.nan)
+
+        moving = np.full(len(rows), np.nan)
+        positions = {}
+        for city, start, end in zip(cities, starts, ends):
+            positions[city] = order[start:end]
+            tail = self._tails.get(city, np.empty(0))
+            combined = np.concatenate((tail, values[positions[city]]))
+            bounds = np.array([0]), np.array([len(combined)])
+            moving[positions[city]] = rolling_mean(combined, *bounds, self.window)[len(tail):]
+            self._tails[city] = combined[max(len(combined) - self.window + 1, 0):]
+
+        moments = self.aggregates.city_moments.reindex(cities)
+        known = codes >= 0
+        with np.errstate(invalid="ignore", divide="ignore"):
+            std = np.sqrt(moments["m2"] / (moments["count"] - 1)).to_numpy()
+        mean = np.where(known, moments["mean"].to_numpy()[codes], np.nan)
+        spread = self.std_dev_factor * np.where(known, std[codes], np.nan)
+
+        rows["moving_avg"] = moving
+        rows["is_anomaly"] = (values < mean - spread) | (values > mean + spread)
+        self.analysis = self.analysis.append(rows, positions)
+        return rows
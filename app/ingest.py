@@ -0,0 +1,122 @@
+import importlib.util
+import io
+import pandas as pd
+from app.cache import memoized
+from app.metrics import timed
+
+# Сам pyarrow импортируется только при первом чтении: проверка наличия не должна замедлять старт.
+HAS_PYARROW = importlib.util.find_spec("pyarrow") is not None
+
+
+__all__ = [
+    'HAS_PYARROW',
+    'CATEGORICAL_COLUMNS',
+    'FLOAT32_COLUMNS',
+    'REQUIRED_COLUMNS',
+    'optimize_dtypes',
+    'read_temperature_csv',
+    'read_temperature_parquet',
+    'load_dataset',
+    'to_parquet_bytes',
+    'align_rows',
+    'append_rows',
+]
+
+
+CATEGORICAL_COLUMNS = ("city", "season")
+FLOAT32_COLUMNS = ("temperature",)
+TIMESTAMP_COLUMN = "timestamp"
+REQUIRED_COLUMNS = ("city", TIMESTAMP_COLUMN, "temperature", "season")
+
+
+def optimize_dtypes(df):
+    """Приводит столбцы к компактным типам: дата — datetime64, город и сезон — category, температура — float32."""
+    df = df.copy(deep=False)
+    if TIMESTAMP_COLUMN in df.columns and not pd.api.types.is_datetime64_any_dtype(df[TIMESTAMP_COLUMN]):
+        df[TIMESTAMP_COLUMN] = pd.to_datetime(df[TIMESTAMP_COLUMN])
+    elif TIMESTAMP_COLUMN in df.columns and df[TIMESTAMP_COLUMN].dtype.kind == "M" and \
+            getattr(df[TIMESTAMP_COLUMN].dtype, "tz", None) is None:
+        # pyarrow возвращает даты в секундах или микросекундах; приводим к единой точности.
+        df[TIMESTAMP_COLUMN] = df[TIMESTAMP_COLUMN].astype("datetime64[ns]")
+    for column in CATEGORICAL_COLUMNS:
+        if column in df.columns and not isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].astype("category")
+    for column in FLOAT32_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].astype("float32")
+    return df
+
+
+def _header(source):
+    position = source.tell() if hasattr(source, "tell") else None
+    columns = pd.read_csv(source, nrows=0).columns
+    if position is not None:
+        source.seek(position)
+    return columns
+
+
+def read_temperature_csv(source, engine=None):
+    """Читает CSV сразу в компактные типы, дата разбирается один раз.
+
+    По умолчанию используется движок pyarrow, если он установлен.
+    """
+    if engine is None:
+        engine = "pyarrow" if HAS_PYARROW else "c"
+    columns = _header(source)
+    dtype = {column: "category" for column in CATEGORICAL_COLUMNS if column in columns}
+    dtype.update({column: "float32" for column in FLOAT32_COLUMNS if column in columns})
+    # pyarrow сам распознает даты, а разбор через parse_dates превращает пустые ячейки в строку "None".
+    parse_dates = [TIMESTAMP_COLUMN] if TIMESTAMP_COLUMN in columns and engine != "pyarrow" else False
+    df = pd.read_csv(source, engine=engine, dtype=dtype, parse_dates=parse_dates)
+    return optimize_dtypes(df)
+
+
+def read_temperature_parquet(source):
+    return optimize_dtypes(pd.read_parquet(source))
+
+
+@timed("ingest")
+def load_dataset(source, name=None):
+    """Загружает набор данных из CSV или Parquet в зависимости от расширения файла."""
+    name = name or getattr(source, "name", str(source))
+    if str(name).lower().endswith(".parquet"):
+        return read_temperature_parquet(source)
+    return read_temperature_csv(source)
+
+
+def align_rows(df, rows):
+    """Приводит новые строки к схеме `df`: те же столбцы и типы, общие категории, индекс продолжает индекс `df`.
+
+    Из столбцов `df` обязательны только `REQUIRED_COLUMNS`, без них — ValueError; остальные, если их нет
+    в новых строках, заполняются пропусками. Возвращает `df` (с расширенными категориями) и подготовленные строки.
+    """
+    missing = [column for column in REQUIRED_COLUMNS if column in df.columns and column not in rows.columns]
+    if missing:
+        raise ValueError(f"В новых наблюдениях нет столбцов: {', '.join(missing)}")
+    rows = rows.reindex(columns=df.columns)
+    df = df.copy(deep=False)
+    for column in df.columns:
+        if df[column].dtype.kind in "iub" and rows[column].isna().any():
+            df[column] = df[column].astype("float64" if df[column].dtype.kind in "iu" else object)
+    rows = optimize_dtypes(rows)
+    for column in CATEGORICAL_COLUMNS:
+        if column in df.columns:
+            categories = df[column].cat.categories.union(rows[column].cat.categories, sort=False)
+            df[column] = df[column].cat.set_categories(categories)
+            rows[column] = rows[column].cat.set_categories(categories)
+    rows = rows.astype(df.dtypes.to_dict())
+    rows.index = pd.RangeIndex(len(df), len(df) + len(rows))
+    return df, rows
+
+
+def append_rows(df, rows):
+    """Дописывает новые наблюдения в конец набора данных, сохраняя компактные типы."""
+    df, rows = align_rows(df, rows)
+    return pd.concat([df, rows])
+
+
+@memoized("parquet_bytes")
+def to_parquet_bytes(df):
+    buffer = io.BytesIO()
+    df.to_parquet(buffer, index=False)
+    return buffer.getvalue()
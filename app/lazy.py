@@ -0,0 +1,48 @@
+import importlib
+import logging
+import os
+import sys
+import time
+import pandas as pd
+from app.metrics import metrics
+
+
+__all__ = ['IMPORT_BUDGET_MS', 'load', 'record_import', 'import_report']
+
+
+IMPORT_BUDGET_MS = float(os.environ.get("IMPORT_BUDGET_MS", 1000))
+
+logger = logging.getLogger("app.imports")
+_import_times = {}
+
+
+def record_import(name, seconds, budget_ms=IMPORT_BUDGET_MS):
+    """Запоминает время первого импорта `name`; повторные замеры (уже загруженный модуль) не учитываются."""
+    if name in _import_times:
+        return
+    _import_times[name] = seconds
+    metrics.observe("import", seconds)
+    if seconds * 1000 > budget_ms:
+        logger.warning("Импорт %s занял %.0f мс при бюджете %.0f мс", name, seconds * 1000, budget_ms)
+
+
+def load(target):
+    """Возвращает объект по строке "модуль:имя", импортируя модуль при первом обращении.
+
+    Так страницы и их тяжелые зависимости (plotly, aiohttp) загружаются, только когда вкладку открыли.
+    """
+    module_name, attribute = target.split(":")
+    module = sys.modules.get(module_name)
+    if module is None:
+        start_time = time.perf_counter()
+        module = importlib.import_module(module_name)
+        record_import(module_name, time.perf_counter() - start_time)
+    return getattr(module, attribute)
+
+
+def import_report(budget_ms=IMPORT_BUDGET_MS):
+    """Время первого импорта модулей с отметкой о превышении бюджета."""
+    report = pd.DataFrame(
+        [(name, seconds * 1000) for name, seconds in _import_times.items()], columns=["module", "ms"]
+    )
+    return report.assign(over_budget=report["ms"] > budget_ms)
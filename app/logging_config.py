@@ -1,24 +1,85 @@
+import atexit
+import itertools
 import logging
-from logging.handlers import RotatingFileHandler
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from pathlib import Path
 import requests
+from app.metrics import timed
 
 
-__all__ = ['LoggedSession']
+__all__ = ['LoggedSession', 'SamplingFilter', 'configure_logging']
+
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+logger = logging.getLogger("app.http")
+_listener = None
+_request_ids = itertools.count()
+
+
+class SamplingFilter(logging.Filter):
+    """Оставляет записи только каждого `every`-го HTTP-запроса (по `request_id`, чтобы запрос и ответ
+    попадали в лог вместе); предупреждения, ошибки и записи без `request_id` проходят всегда.
+    """
+
+    def __init__(self, every=1):
+        super().__init__()
+        self.every = max(int(every), 1)
+
+    def filter(self, record):
+        request_id = getattr(record, "request_id", None)
+        return record.levelno >= logging.WARNING or request_id is None or request_id % self.every == 0
+
+
+def configure_logging(level=None, path=None, max_bytes=10 * 2 ** 20, backup_count=5, sample_every=None):
+    """Настраивает логирование один раз на процесс: записи уходят в очередь, а в файл с ротацией
+    их пишет отдельный поток, так что запросы не ждут дискового ввода-вывода.
+
+    Параметры по умолчанию берутся из переменных окружения LOG_LEVEL, LOG_FILE и LOG_SAMPLE_EVERY
+    (логировать каждый N-й HTTP-запрос).
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    level = level or os.environ.get("LOG_LEVEL", "INFO")
+    path = Path(path or os.environ.get("LOG_FILE", "logs/app.log"))
+    sample_every = int(sample_every or os.environ.get("LOG_SAMPLE_EVERY", 1))
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    file_handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    records = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(QueueHandler(records))
+    logger.addFilter(SamplingFilter(sample_every))
+
+    _listener = QueueListener(records, file_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return _listener
 
 
 class LoggedSession(requests.Session):
     def request(self, method, url, **kwargs):
-        logging.info(f"Запрос: {method} {url}")
+        extra = {"request_id": next(_request_ids)}
+        logger.info("Запрос: %s %s", method, url, extra=extra)
         if "data" in kwargs:
-            logging.info(f"Данные запроса: {kwargs['data']}")
+            logger.info("Данные запроса: %s", kwargs["data"], extra=extra)
         if "json" in kwargs:
-            logging.info(f"JSON запрос: {kwargs['json']}")
+            logger.info("JSON запрос: %s", kwargs["json"], extra=extra)
         if "files" in kwargs:
-            logging.info(f"Файлы запроса: {kwargs['files']}")
+            logger.info("Файлы запроса: %s", kwargs["files"], extra=extra)
 
-        response = super().request(method, url, **kwargs)
+        with timed("http"):
+            response = super().request(method, url, **kwargs)
 
-        logging.info(f"Ответ от {url}: {response.status_code}")
-        logging.debug(f"Ответ тела: {response.text[:200]}")
+        logger.info("Ответ от %s: %s", url, response.status_code, extra=extra)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Ответ тела: %s", response.text[:200], extra=extra)
 
         return response
@@ -0,0 +1,108 @@
+import threading
+import time
+from functools import wraps
+import pandas as pd
+
+
+__all__ = ['Metrics', 'metrics', 'timed']
+
+
+class _Timer:
+    def __init__(self, registry, stage):
+        self.registry = registry
+        self.stage = stage
+
+    def __call__(self, func):
+        # Каждый вызов декорированной функции получает свой таймер: иначе параллельные вызовы
+        # из разных сессий перезаписывали бы общее время начала.
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with _Timer(self.registry, self.stage):
+                return func(*args, **kwargs)
+        return wrapper
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.registry.observe(self.stage, time.perf_counter() - self._start)
+        return False
+
+
+class Metrics:
+    """Длительности этапов и счетчики.
+
+    Сводка копится за все время работы процесса, а отдельно — этапы текущего перезапуска скрипта
+    (они привязаны к потоку, в котором Streamlit выполняет скрипт сессии).
+    """
+
+    def __init__(self):
+        self._timings = {}
+        self._gauges = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def timed(self, stage):
+        """Контекстный менеджер и декоратор: `with timed("groupby"):` или `@timed("ingest")`."""
+        return _Timer(self, stage)
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            count, total, maximum, _ = self._timings.get(stage, (0, 0.0, 0.0, 0.0))
+            self._timings[stage] = (count + 1, total + seconds, max(maximum, seconds), seconds)
+        run = getattr(self._local, "run", None)
+        if run is not None:
+            run.append((stage, seconds))
+
+    def gauge(self, name, read):
+        """Регистрирует показатель, значение которого читается вызовом `read()` в момент выгрузки."""
+        self._gauges[name] = read
+
+    def start_run(self):
+        self._local.run = []
+        self._local.started = time.perf_counter()
+
+    def run_elapsed(self):
+        started = getattr(self._local, "started", None)
+        return None if started is None else time.perf_counter() - started
+
+    def run_timings(self):
+        """Этапы текущего перезапуска: число вызовов и суммарное время по каждому этапу."""
+        run = getattr(self._local, "run", None) or []
+        frame = pd.DataFrame(run, columns=["stage", "seconds"])
+        summary = frame.groupby("stage", sort=False)["seconds"].agg(["count", "sum"]).reset_index()
+        return summary.rename(columns={"sum": "total_ms"}).assign(total_ms=lambda s: s["total_ms"] * 1000)
+
+    def timings(self):
+        with self._lock:
+            items = sorted(self._timings.items())
+        return pd.DataFrame(
+            [(stage, count, total * 1000, total / count * 1000, maximum * 1000, last * 1000)
+             for stage, (count, total, maximum, last) in items],
+            columns=["stage", "count", "total_ms", "mean_ms", "max_ms", "last_ms"],
+        )
+
+    def gauges(self):
+        return {name: read() for name, read in self._gauges.items()}
+
+    def to_prometheus(self, prefix="weather_app"):
+        """Метрики в текстовом формате Prometheus."""
+        lines = [f"# TYPE {prefix}_stage_seconds summary"]
+        with self._lock:
+            items = sorted(self._timings.items())
+        for stage, (count, total, _, _) in items:
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {count}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {total:.6f}')
+        for name, value in sorted(self.gauges().items()):
+            lines.append(f"# TYPE {prefix}_{name} gauge")
+            lines.append(f"{prefix}_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._timings.clear()
+
+
+metrics = Metrics()
+timed = metrics.timed
@@ -1,33 +1,25 @@
 import time
 import asyncio
-import aiohttp
-import requests
+import pandas as pd
 import streamlit as st
 from datetime import datetime
+from app.baseline import seasonal_baseline
 from app.logging_config import LoggedSession
+from app.metrics import metrics
 from app.settings.api_client import OpenWeatherMapClient
 
 
 owmc = OpenWeatherMapClient(api_key='...')
-
-
-async def fetch_async(session, url):
-    async with session.get(url) as response:
-        return await response.json()
+metrics.gauge("owm_cache_hits", lambda: owmc.cache.hits)
+metrics.gauge("owm_cache_misses", lambda: owmc.cache.misses)
 
 
 async def get_current_temperature_async(city, api_key):
-    url = f"http://api.openweathermap.org/data/2.5/weather?q={city}&appid={api_key}&units=metric"
-    async with aiohttp.ClientSession() as session:
-        data = await fetch_async(session, url)
-        return data['main']['temp']
+    return await asyncio.wrap_future(owmc.submit(owmc.fetch_temperature_async(city, api_key)))
 
 
 def get_current_temperature_sync(city, api_key):
-    url = f"http://api.openweathermap.org/data/2.5/weather?q={city}&appid={api_key}&units=metric"
-    response = requests.get(url)
-    data = response.json()
-    return data['main']['temp']
+    return owmc.get_current_temperature(city, api_key)
 
 
 def is_temperature_normal(current_temp, season_data):
@@ -49,45 +41,68 @@ def get_season(date):
 
 
 def check_api_key(api_key):
-    test_city = "London"
-    url = f"http://api.openweathermap.org/data/2.5/weather?q={test_city}&appid={api_key}&units=metric"
-    response = requests.get(url)
-    return response.status_code == 200
+    return owmc.check_api_key(api_key)
+
+
+def display_temperature_status(baseline, city, current_temp):
+    current_date = datetime.now()
+    season = get_season(current_date)
+    season_data = baseline.lookup(city, season)
+    if season_data is None or not current_temp:
+        return
+
+    if is_temperature_normal(current_temp, season_data):
+        st.success(f"Текущая температура {current_temp}°C нормальна для сезона {season}.")
+    else:
+        st.warning(f"Текущая температура {current_temp}°C выходит за пределы нормы для сезона {season}.")
 
+    day_normal = baseline.day_normal(city, current_date)
+    if day_normal is not None:
+        st.write(f"Средняя историческая температура на эту дату: {day_normal:.2f}°C")
 
-def check_temperature_normal(df, city, api_key):
-    city_data = df[df['city'] == city]
-    if not city_data.empty:
-        current_date = datetime.now()
-        season = get_season(current_date)
-        season_data = city_data.groupby('season')['temperature'].agg(
-            mean='mean', q1=lambda x: x.quantile(0.25), q3=lambda x: x.quantile(0.75)
-        ).loc[season]
 
+def check_temperature_normal(df, city, api_key, current_temp=None):
+    if current_temp is None:
         current_temp = get_current_temperature_sync(city, api_key)
-        if current_temp:
-            if is_temperature_normal(current_temp, season_data):
-                st.success(f"Текущая температура {current_temp}°C нормальна для сезона {season}.")
-            else:
-                st.warning(f"Текущая температура {current_temp}°C выходит за пределы нормы для сезона {season}.")
+    display_temperature_status(seasonal_baseline(df), city, current_temp)
+
+
+def check_all_cities(baseline, api_key):
+    """Текущая температура и статус нормы для всех городов из индекса исторической нормы."""
+    season = get_season(datetime.now())
+    temperatures = owmc.get_current_temperatures(baseline.cities, api_key)
+
+    table = baseline.season_table(season)[["city", "q1", "q3"]]
+    table.insert(1, "temperature", pd.Series([temperatures[city] for city in table["city"]], dtype="float64"))
+    table.insert(2, "season", season)
+    is_normal = table["temperature"].between(table["q1"], table["q3"])
+    table["status"] = is_normal.map({True: "нормальная", False: "аномальная"})
+    table.loc[table["temperature"].isna() | table["q1"].isna(), "status"] = "нет данных"
+    return table
+
+
+def dataset_baseline(session: LoggedSession):
+    if hasattr(session, "df"):
+        return seasonal_baseline(session.df)
+    if hasattr(session, "streamed"):
+        return session.streamed.baseline
+    return None
 
 
 def monitor_temperature(session: LoggedSession):
     st.header("🌡️ Текущая температура")
 
-    if not hasattr(session, "df"):
+    baseline = dataset_baseline(session)
+    if baseline is None:
         st.warning("Загрузите данные на вкладке '📁 Загрузка данных'.")
         return
 
-    df = session.df
-
     api_key = st.text_input("Введите API ключ OpenWeatherMap", type="password")
 
     if api_key:
         if check_api_key(api_key):
             st.success("API ключ корректный.")
-            cities = df["city"].unique().tolist()
-            city = st.selectbox("Выберите город", cities)
+            city = st.selectbox("Выберите город", baseline.cities)
 
             if st.button("Получить температуру (синхронно)"):
                 start_time = time.time()
@@ -96,7 +111,7 @@ def monitor_temperature(session: LoggedSession):
                 if current_temp:
                     st.write(f"Текущая температура в {city}: {current_temp}°C")
                     st.write(f"Время выполнения: {end_time - start_time:.2f} секунд")
-                    check_temperature_normal(df, city, api_key)
+                    display_temperature_status(baseline, city, current_temp)
                 else:
                     st.error("Ошибка при получении температуры.")
 
@@ -107,9 +122,16 @@ def monitor_temperature(session: LoggedSession):
                 if current_temp:
                     st.write(f"Текущая температура в {city}: {current_temp}°C")
                     st.write(f"Время выполнения: {end_time - start_time:.2f} секунд")
-                    check_temperature_normal(df, city, api_key)
+                    display_temperature_status(baseline, city, current_temp)
                 else:
                     st.error("Ошибка при получении температуры.")
+
+            if st.button("Получить температуру для всех городов"):
+                start_time = time.time()
+                table = check_all_cities(baseline, api_key)
+                end_time = time.time()
+                st.write(f"Время выполнения: {end_time - start_time:.2f} секунд для {len(table)} городов")
+                st.dataframe(table, width=1000)
         else:
             st.error("Неверный ключ API. "
                      "Пожалуйста, смотрите раздел "
@@ -1,30 +1,57 @@
 import time
-from multiprocessing import Pool
+from functools import partial
 import streamlit as st
-import numpy as np
+import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 from app.logging_config import LoggedSession
-from scipy.stats import skew, kurtosis
-
-
-def display_descriptive_statistics(city_data):
+from app.anomalies import METHODS, flag_anomalies
+from app.analysis import (analyze_cities, analyze_city, calculate_moving_average, calculate_rolling_quantiles,
+                          detect_anomalies, seasonal_profile)
+from app.metrics import timed
+from app.cache import fingerprint, memoized, result_cache
+from app.downsampling import DEFAULT_POINTS, downsample, time_window
+from app.parallel import PARALLEL_MIN_ROWS, shared_memory_kernel
+from app.registry import datasets
+from app.statistics import moment_statistics
+
+
+STATISTICS_COLUMNS = {
+    "count": "Наблюдений",
+    "mean": "Среднее",
+    "std": "Стд. отклонение",
+    "min": "Минимум",
+    "q1": "25%",
+    "median": "Медиана",
+    "q3": "75%",
+    "max": "Максимум",
+    "skewness": "Скошенность",
+    "kurtosis": "Эксцесс",
+}
+OVERVIEW_GROUPINGS = {"Города": ("city",), "Города и сезоны": ("city", "season")}
+
+
+def city_statistics(city_data):
+    """Строка `moment_statistics` для данных одного города."""
+    return moment_statistics.uncached(city_data.assign(city=0)).iloc[0]
+
+
+def display_descriptive_statistics(city_data, stats=None):
+    """`stats` — строка города из `moment_statistics`; без нее статистика считается по `city_data`."""
     st.subheader("Описательная статистика")
 
-    desc_stats = city_data.describe()
-
-    skewness = skew(city_data["temperature"])
-    kurt = kurtosis(city_data["temperature"])
+    if stats is None:
+        stats = city_statistics(city_data)
 
-    st.write(desc_stats)
+    st.write(stats[list(STATISTICS_COLUMNS)].rename(STATISTICS_COLUMNS).rename("temperature").to_frame())
 
-    mean_temp = desc_stats.loc["mean", "temperature"]
-    median_temp = desc_stats.loc["50%", "temperature"]
-    std_temp = desc_stats.loc["std", "temperature"]
-    min_temp = desc_stats.loc["min", "temperature"]
-    max_temp = desc_stats.loc["max", "temperature"]
-    q1_temp = desc_stats.loc["25%", "temperature"]
-    q3_temp = desc_stats.loc["75%", "temperature"]
+    mean_temp = stats["mean"]
+    median_temp = stats["median"]
+    std_temp = stats["std"]
+    min_temp = stats["min"]
+    max_temp = stats["max"]
+    skewness = stats["skewness"]
+    kurt = stats["kurtosis"]
 
     st.markdown(f"### Анализ описательной статистики:")
 
@@ -64,6 +91,16 @@ def display_descriptive_statistics(city_data):
         """)
 
     st.subheader("Распределение температуры")
+    st.plotly_chart(distribution_figure(city_data, stats), use_container_width=True)
+
+
+@memoized("distribution_figure")
+@timed("figure")
+def distribution_figure(city_data, stats=None):
+    stats = city_statistics(city_data) if stats is None else stats
+    mean_temp, median_temp, std_temp = stats["mean"], stats["median"], stats["std"]
+    q1_temp, q3_temp = stats["q1"], stats["q3"]
+
     fig = px.histogram(city_data, x="temperature", nbins=30, title="Распределение температуры")
 
     fig.add_vline(x=mean_temp, line_dash="dash", line_color="red", annotation_text=f"Среднее: {mean_temp:.2f}°C",
@@ -80,21 +117,38 @@ def display_descriptive_statistics(city_data):
         fillcolor="lightgray", opacity=0.5,
         annotation_text=f"±1σ: {std_temp:.2f}°C", annotation_position="top"
     )
+    return fig
+
 
-    st.plotly_chart(fig, use_container_width=True)
+def select_time_window(data, key, per="графике"):
+    """Ползунок периода для длинных рядов: выбранный интервал перерисовывается в полном разрешении."""
+    if len(data) <= DEFAULT_POINTS:
+        return None, None
+    timestamps = pd.to_datetime(data["timestamp"])
+    start, end = timestamps.min().to_pydatetime(), timestamps.max().to_pydatetime()
+    return st.slider("Период", min_value=start, max_value=end, value=(start, end), key=key,
+                     help=f"На {per} не больше {DEFAULT_POINTS} точек; сузьте период, чтобы увидеть все наблюдения.")
 
 
 def display_temperature_time_series(city_data, city):
     st.subheader("Временной ряд температуры с аномалиями")
+    start, end = select_time_window(city_data, key="time_series_window")
+    st.plotly_chart(time_series_figure(city_data, city, start, end), use_container_width=True)
 
-    threshold = np.percentile(city_data["temperature"], 90)
-    city_data["is_anomaly"] = city_data["temperature"] > threshold
+
+@memoized("time_series_figure")
+@timed("figure")
+def time_series_figure(city_data, city, start=None, end=None):
+    window = city_data if "is_anomaly" in city_data.columns else city_data.assign(is_anomaly=flag_anomalies(city_data))
+    if start is not None:
+        window = time_window(window, start, end)
+    line_data = downsample(window, "timestamp", "temperature", keep=window["is_anomaly"])
 
     fig = go.Figure()
     fig.add_trace(
         go.Scatter(
-            x=city_data["timestamp"],
-            y=city_data["temperature"],
+            x=line_data["timestamp"],
+            y=line_data["temperature"],
             mode="lines",
             name="Температура",
             line=dict(color="blue", width=2),
@@ -102,8 +156,8 @@ def display_temperature_time_series(city_data, city):
     )
     fig.add_trace(
         go.Scatter(
-            x=city_data[city_data["is_anomaly"]]["timestamp"],
-            y=city_data[city_data["is_anomaly"]]["temperature"],
+            x=window[window["is_anomaly"]]["timestamp"],
+            y=window[window["is_anomaly"]]["temperature"],
             mode="markers",
             name="Аномалии",
             marker=dict(color="red", size=8),
@@ -115,44 +169,27 @@ def display_temperature_time_series(city_data, city):
         yaxis_title="Температура (°C)",
         hovermode="x unified",
     )
-    st.plotly_chart(fig, use_container_width=True)
+    return fig
 
 
 def display_correlation_analysis(city_data):
     if "humidity" in city_data.columns and "pressure" in city_data.columns:
         st.subheader("Корреляция температуры с другими параметрами")
-        corr_matrix = city_data[["temperature", "humidity", "pressure"]].corr()
-        fig = px.imshow(corr_matrix, text_auto=True, title="Матрица корреляции")
-        st.plotly_chart(fig, use_container_width=True)
+        st.plotly_chart(correlation_figure(city_data), use_container_width=True)
+
+
+@memoized("correlation_figure")
+@timed("figure")
+def correlation_figure(city_data):
+    corr_matrix = city_data[["temperature", "humidity", "pressure"]].corr()
+    return px.imshow(corr_matrix, text_auto=True, title="Матрица корреляции")
 
 
 def display_seasonal_profiles(city_data, city):
     st.subheader("Сезонные профили температуры")
 
-    seasonal_data = city_data.groupby("season")["temperature"].agg(
-        mean="mean",
-        std="std",
-        median="median",
-        q1=lambda x: x.quantile(0.25),
-        q3=lambda x: x.quantile(0.75),
-        count="size"
-    ).reset_index()
-
-    fig = go.Figure()
-    fig.add_trace(
-        go.Bar(
-            x=seasonal_data["season"],
-            y=seasonal_data["mean"],
-            error_y=dict(type="data", array=seasonal_data["std"], visible=True),
-            name="Средняя температура",
-        )
-    )
-    fig.update_layout(
-        title=f"Сезонные профили температуры в городе {city}",
-        xaxis_title="Сезон",
-        yaxis_title="Средняя температура (°C)",
-    )
-    st.plotly_chart(fig, use_container_width=True)
+    seasonal_data = seasonal_profile(city_data)
+    st.plotly_chart(seasonal_profile_figure(seasonal_data, city), use_container_width=True)
 
     st.markdown("### Анализ сезонных профилей температуры:")
     for index, row in seasonal_data.iterrows():
@@ -190,45 +227,71 @@ def display_seasonal_profiles(city_data, city):
                 st.markdown(f"Разброс температуры в сезоне **{season}** значительный, что указывает на изменчивые условия.")
 
 
-def calculate_moving_average(data, window=30):
-    return data["temperature"].rolling(window=window, min_periods=1).mean()
-
-
-def detect_anomalies(data):
-    """Выявляет аномалии, где температура выходит за пределы среднее ± 2σ."""
-    mean = data["temperature"].mean()
-    std = data["temperature"].std()
-    data["is_anomaly"] = (data["temperature"] < (mean - 2 * std)) | (data["temperature"] > (mean + 2 * std))
-    return data
-
-
-def analyze_city(city_data):
-    """Анализирует данные для одного города."""
-    city_data = city_data.copy()
-    city_data["moving_avg"] = calculate_moving_average(city_data)
-    city_data = detect_anomalies(city_data)
-    return city_data
+@memoized("seasonal_profile_figure")
+@timed("figure")
+def seasonal_profile_figure(seasonal_data, city):
+    fig = go.Figure()
+    fig.add_trace(
+        go.Bar(
+            x=seasonal_data["season"],
+            y=seasonal_data["mean"],
+            error_y=dict(type="data", array=seasonal_data["std"], visible=True),
+            name="Средняя температура",
+        )
+    )
+    fig.update_layout(
+        title=f"Сезонные профили температуры в городе {city}",
+        xaxis_title="Сезон",
+        yaxis_title="Средняя температура (°C)",
+    )
+    return fig
 
 
-def analyze_data_parallel(df):
-    cities = df["city"].unique()
-    with Pool() as pool:
-        results = pool.map(analyze_city, [df[df["city"] == city] for city in cities])
-    return results
+def analyze_data_parallel(df, min_rows=None):
+    return analyze_cities(df, kernel=partial(shared_memory_kernel, min_rows=min_rows))
 
 
 def analyze_data_sequential(df):
-    results = []
-    for city in df["city"].unique():
-        city_data = df[df["city"] == city]
-        results.append(analyze_city(city_data))
-    return results
+    return analyze_cities(df)
 
 
 def display_moving_average(city_data, city):
-    st.subheader("Скользящее среднее температуры (30 дней)")
-    fig = px.line(city_data, x="timestamp", y="moving_avg", title=f"Скользящее среднее температуры в городе {city}")
-    st.plotly_chart(fig, use_container_width=True)
+    st.subheader("Скользящее среднее и медиана температуры")
+    window = st.number_input("Окно, наблюдений", min_value=2, max_value=max(len(city_data), 2),
+                             value=min(30, max(len(city_data), 2)), step=1, key="rolling_window",
+                             help="Для суточных данных — дни, для почасовых — часы.")
+    start, end = select_time_window(city_data, key="moving_average_window")
+    st.plotly_chart(moving_average_figure(city_data, city, start, end, window=int(window)), use_container_width=True)
+
+
+@memoized("rolling_bands")
+def rolling_bands(city_data, window=30):
+    """Скользящие среднее, медиана и квартили температуры города."""
+    bands = calculate_rolling_quantiles(city_data, window)
+    bands["moving_avg"] = calculate_moving_average(city_data, window)
+    bands.insert(0, "timestamp", city_data["timestamp"])
+    return bands
+
+
+@memoized("moving_average_figure")
+@timed("figure")
+def moving_average_figure(city_data, city, start=None, end=None, window=30):
+    bands = rolling_bands(city_data, window)
+    if start is not None:
+        bands = time_window(bands, start, end)
+    bands = downsample(bands, "timestamp", "rolling_median")
+
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=bands["timestamp"], y=bands["rolling_q3"], mode="lines", line=dict(width=0),
+                             name="Q3", showlegend=False))
+    fig.add_trace(go.Scatter(x=bands["timestamp"], y=bands["rolling_q1"], mode="lines", line=dict(width=0),
+                             fill="tonexty", fillcolor="rgba(99, 110, 250, 0.2)", name="Q1 – Q3"))
+    fig.add_trace(go.Scatter(x=bands["timestamp"], y=bands["rolling_median"], mode="lines", name="Медиана"))
+    fig.add_trace(go.Scatter(x=bands["timestamp"], y=bands["moving_avg"], mode="lines", name="Среднее",
+                             line=dict(dash="dot")))
+    fig.update_layout(title=f"Скользящие среднее, медиана и квартили в городе {city} (окно {window})",
+                      xaxis_title="Дата", yaxis_title="Температура (°C)")
+    return fig
 
 
 def classify_anomalies(city_data):
@@ -249,46 +312,122 @@ def display_anomalies(city_data, city):
         st.write(f"- Низкие аномалии (ниже среднего): {len(low_anomalies)}")
         st.write(f"- Высокие аномалии (выше среднего): {len(high_anomalies)}")
 
-    fig = px.scatter(anomalies, x="timestamp", y="temperature", title=f"Аномалии температуры в городе {city}")
-    st.plotly_chart(fig, use_container_width=True)
+    st.plotly_chart(anomalies_figure(anomalies, city), use_container_width=True)
+
+
+@memoized("anomalies_figure")
+@timed("figure")
+def anomalies_figure(anomalies, city):
+    return px.scatter(anomalies, x="timestamp", y="temperature", title=f"Аномалии температуры в городе {city}")
+
+
+SECTIONS = {
+    "Описательная статистика": lambda city_data, city: display_descriptive_statistics(city_data),
+    "Временной ряд": display_temperature_time_series,
+    "Скользящее среднее": display_moving_average,
+    "Аномалии": display_anomalies,
+    "Корреляция": lambda city_data, city: display_correlation_analysis(city_data),
+    "Сезонные профили": display_seasonal_profiles,
+}
+DEFAULT_SECTIONS = ["Описательная статистика", "Временной ряд"]
+
+
+def select_sections(sections, default, key):
+    """Разделы, которые пользователь раскрыл: остальные не вычисляются и не отрисовываются."""
+    return st.multiselect("Разделы", list(sections), default=default, key=key)
+
+
+def select_anomaly_method():
+    return st.selectbox("Метод выявления аномалий", list(METHODS), format_func=METHODS.get, key="anomaly_method")
+
+
+def display_city_sections(city_data, city, sections=tuple(SECTIONS), summary=None):
+    """`summary` — таблица `moment_statistics` всех городов, из которой берется строка выбранного города."""
+    for name in sections:
+        if name == "Описательная статистика" and summary is not None:
+            display_descriptive_statistics(city_data, summary.loc[city])
+        else:
+            SECTIONS[name](city_data, city)
+
+
+def display_statistics_overview(df):
+    with st.expander("📋 Статистика по всем городам"):
+        grouping = st.radio("Группировка", list(OVERVIEW_GROUPINGS), horizontal=True, key="overview_grouping")
+        by = OVERVIEW_GROUPINGS[grouping]
+        overview = moment_statistics(df, by).rename(columns=STATISTICS_COLUMNS)
+        st.dataframe(overview, hide_index=True, width=1000)
+
+
+def analyze_streamed_data(stream):
+    st.info("Данные загружены в потоковом режиме: сводки построены по агрегатам, "
+            "строки выбранного города читаются с диска только для детального анализа.")
+
+    st.subheader("Сводная статистика по городам")
+    st.dataframe(stream.aggregates.city_summary(), width=1000)
+
+    city = st.selectbox("Выберите город", stream.cities, key="city_selectbox")
+
+    st.subheader("Сезонная статистика")
+    seasonal_summary = stream.aggregates.seasonal_summary()
+    st.dataframe(seasonal_summary[seasonal_summary["city"] == city], width=1000)
+
+    if st.button("Запустить анализ"):
+        start_time = time.time()
+        analyze_city(stream.city_frame(city))
+        end_time = time.time()
+        st.success(f"Анализ завершен за {end_time - start_time:.2f} секунд.")
+        st.session_state["analyzed_dataset"] = str(stream.path)
+
+    if st.session_state.get("analyzed_dataset") == str(stream.path):
+        method = select_anomaly_method()
+        sections = select_sections(SECTIONS, DEFAULT_SECTIONS, key="analysis_sections")
+        city_data = analyze_city(stream.city_frame(city))
+        city_data["is_anomaly"] = flag_anomalies(city_data, method)
+        display_city_sections(city_data, city, sections)
 
 
 def analyze_data(session: LoggedSession):
     st.header("📊 Анализ данных")
 
     if not hasattr(session, "df"):
+        if hasattr(session, "streamed"):
+            analyze_streamed_data(session.streamed)
+            return
         st.warning("Загрузите данные на вкладке '📁 Загрузка данных'.")
         return
 
     df = session.df
+    display_statistics_overview(df)
 
     city = st.selectbox("Выберите город", df["city"].unique(), key="city_selectbox")
 
-    city_data = df[df["city"] == city]
-
     analysis_mode = st.radio("Режим анализа", ["Последовательный", "Параллельный"])
 
     if st.button("Запустить анализ"):
         start_time = time.time()
 
-        if analysis_mode == "Параллельный":
+        key = ("analyze_cities", fingerprint(df))
+        results = result_cache.get(key)
+        if results is not None:
+            st.info("Результаты анализа для этого набора данных уже рассчитаны, используется кэш.")
+        elif analysis_mode == "Параллельный":
             st.info("Запуск параллельного анализа...")
-            results = analyze_data_parallel(df)
+            if len(df) < PARALLEL_MIN_ROWS:
+                st.info(f"Набор данных меньше {PARALLEL_MIN_ROWS} строк — анализ выполняется в текущем процессе.")
+            results = result_cache.put(key, analyze_data_parallel(df))
         else:
             st.info("Запуск последовательного анализа...")
-            results = analyze_data_sequential(df)
+            results = result_cache.put(key, analyze_data_sequential(df))
 
         end_time = time.time()
         st.success(f"Анализ завершен за {end_time - start_time:.2f} секунд.")
-
-        for result in results:
-            if result["city"].iloc[0] == city:
-                city_data = result
-                break
-
-        display_descriptive_statistics(city_data)
-        display_temperature_time_series(city_data, city)
-        display_moving_average(city_data, city)
-        display_anomalies(city_data, city)
-        display_correlation_analysis(city_data)
-        display_seasonal_profiles(city_data, city)
+        st.session_state["analyzed_dataset"] = fingerprint(df)
+        datasets.save_analysis(fingerprint(df), results)
+
+    if st.session_state.get("analyzed_dataset") == fingerprint(df):
+        results = result_cache.get_or_compute(("analyze_cities", fingerprint(df)), lambda: analyze_data_sequential(df))
+        method = select_anomaly_method()
+        sections = select_sections(SECTIONS, DEFAULT_SECTIONS, key="analysis_sections")
+        city_data = results.city(city)
+        city_data["is_anomaly"] = flag_anomalies(results.frame, method).iloc[results.slices[city]].to_numpy()
+        display_city_sections(city_data, city, sections, moment_statistics(df).set_index("city"))
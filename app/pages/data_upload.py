@@ -1,31 +1,195 @@
+import time
+import uuid
 import streamlit as st
-import pandas as pd
+from pathlib import Path
 from app.logging_config import LoggedSession
+from app.baseline import seasonal_baseline
+from app.cache import fingerprint, result_cache
+from app.incremental import IncrementalAnalysis
+from app.ingest import append_rows, load_dataset, to_parquet_bytes
+from app.registry import datasets
+from app.preview import PAGE_SIZES, append_summaries, city_counts, column_summary, page_count, preview_page
+from app.streaming import stream_csv
+
+
+def _source_id(uploaded_file):
+    return getattr(uploaded_file, "file_id", None) or (uploaded_file.name, uploaded_file.size)
+
+
+def upload_streamed_dataset(session: LoggedSession, uploaded_file):
+    if getattr(session, "source_id", None) != _source_id(uploaded_file) or not hasattr(session, "streamed"):
+        with st.spinner("Потоковая обработка файла..."):
+            session.streamed = stream_csv(uploaded_file)
+        session.source_id = _source_id(uploaded_file)
+        if hasattr(session, "df"):
+            del session.df
+
+    stream = session.streamed
+    st.success("Данные обработаны в потоковом режиме!")
+    st.markdown(f"- Всего строк: `{stream.aggregates.rows}`")
+    st.markdown(f"- Городов: `{len(stream.cities)}`")
+
+    st.write("Сводная статистика по городам:")
+    st.dataframe(stream.aggregates.city_summary(), width=1000)
+    st.write(f"Первые {len(stream.preview)} строк `{uploaded_file.name}`:")
+    st.dataframe(stream.preview, width=1000)
+
+
+def display_dataset_summary(df):
+    st.subheader("Сводка по набору данных")
+    columns_col, cities_col = st.columns([3, 2])
+    with columns_col:
+        st.write("Столбцы:")
+        st.dataframe(column_summary(df), hide_index=True)
+    with cities_col:
+        st.write("Строк по городам:")
+        st.dataframe(city_counts(df), hide_index=True)
+
+
+def display_paginated_preview(df, key="preview"):
+    """Показывает одну страницу данных: в браузер уходит только она, а не весь набор."""
+    size_col, page_col = st.columns(2)
+    page_size = size_col.selectbox("Строк на странице", PAGE_SIZES, index=1, key=f"{key}_page_size")
+    pages = page_count(len(df), page_size)
+    page = page_col.number_input(f"Страница (из {pages})", min_value=1, max_value=pages, value=1, step=1,
+                                 key=f"{key}_page")
+    st.dataframe(preview_page(df, page, page_size), width=1000)
+
+
+def append_observations(session: LoggedSession):
+    """Дописывает новые наблюдения к загруженному набору, анализируя только новые строки."""
+    new_file = st.file_uploader(
+        "Добавить новые наблюдения (CSV или Parquet): история не пересчитывается",
+        type=["csv", "parquet"],
+        key="append_uploader",
+    )
+    if new_file is None or _source_id(new_file) in getattr(session, "appended_sources", set()):
+        return
+
+    df = session.df
+    start_time = time.time()
+    incremental = getattr(session, "incremental", None)
+    if incremental is None or getattr(session, "incremental_fingerprint", None) != fingerprint(df):
+        incremental = IncrementalAnalysis.from_frame(df, result_cache.get(("analyze_cities", fingerprint(df))))
+    try:
+        new_rows = incremental.append(load_dataset(new_file))
+    except ValueError as error:
+        st.error(f"Не удалось добавить наблюдения из `{new_file.name}`: {error}")
+        return
+
+    session.df = append_rows(df, new_rows[df.columns])
+    result_cache.put(("analyze_cities", fingerprint(session.df)), incremental.analysis)
+    result_cache.put(("seasonal_baseline", fingerprint(session.df)), incremental.baseline)
+    append_summaries(df, new_rows[df.columns], session.df)
+    session.incremental = incremental
+    session.incremental_fingerprint = fingerprint(session.df)
+    session.appended_sources = getattr(session, "appended_sources", set()) | {_source_id(new_file)}
+
+    st.success(f"Добавлено строк: {len(new_rows)} за {time.time() - start_time:.2f} секунд, "
+               f"аномалий среди них: {int(new_rows['is_anomaly'].sum())}.")
+    anomalies = new_rows[new_rows["is_anomaly"]]
+    if len(anomalies):
+        st.dataframe(anomalies, width=1000)
+
+
+def download_parquet(session: LoggedSession, df, name):
+    """Кнопка скачивания в Parquet: файл собирается только по запросу, а не при каждой перерисовке страницы."""
+    key = fingerprint(df)
+    if st.button("Подготовить файл Parquet для скачивания", key="prepare_parquet"):
+        session.parquet_download = (key, to_parquet_bytes(df))
+    prepared = getattr(session, "parquet_download", None)
+    if prepared is None or prepared[0] != key:
+        return
+    if st.download_button(
+        "Скачать в формате Parquet",
+        data=prepared[1],
+        file_name=f"{Path(name).stem}.parquet",
+        mime="application/octet-stream",
+    ):
+        del session.parquet_download
+
+
+def owner_token(session: LoggedSession):
+    """Метка владельца загрузок. Хранится в адресе страницы (`?owner=...`), поэтому переживает
+    перезапуск сервера и повторное открытие вкладки по той же ссылке.
+    """
+    if not hasattr(session, "owner"):
+        session.owner = st.query_params.get("owner") or uuid.uuid4().hex
+        st.query_params["owner"] = session.owner
+    return session.owner
+
+
+def select_stored_dataset(session: LoggedSession):
+    """Наборы, которые владелец сессии уже загружал: открываются с диска лишь при выборе, без повторной
+    загрузки и разбора файла. Загрузки других пользователей не показываются.
+    """
+    keys = datasets.owned(owner_token(session))
+    if not keys:
+        return None
+
+    def label(key):
+        if key is None:
+            return "—"
+        info = datasets.store.info(key)
+        return f"{info['name'] or key} ({info['rows']} строк, {info['created']})"
+
+    return st.selectbox("Или откройте ранее загруженный набор", [None, *keys], format_func=label, key="stored_dataset")
 
 
 def upload_dataset(session: LoggedSession):
     st.header("📁 Загрузка данных")
 
-    uploaded_file = st.file_uploader("Загрузите файл с температурными данными (CSV)", type="csv")
-
-    if uploaded_file is not None:
-        df = pd.read_csv(uploaded_file)
-        session.df = df
-        st.success("Данные успешно загружены!")
-
-        st.markdown(f"- Столбцы: **{df.columns.tolist()}**")
-        st.markdown(f"- Всего строк: `{len(df)}`")
-        st.write(f"Все данные `{uploaded_file.name}`:")
-
-        st.markdown(
-            """
-            <style>
-                .main .block-container {
-                    max-width: 100%;
-                }
-            </style>
-            """,
-            unsafe_allow_html=True,
-        )
-
-        st.dataframe(df, width=1000)
\ No newline at end of file
+    uploaded_file = st.file_uploader(
+        "Загрузите файл с температурными данными (CSV или Parquet)", type=["csv", "parquet"]
+    )
+    streaming = st.checkbox(
+        "Потоковая загрузка CSV (для файлов, которые не помещаются в память)",
+        help="Файл читается частями: по ходу чтения считаются агрегаты по городам, "
+             "а строки сохраняются на диск в Parquet.",
+    )
+
+    if uploaded_file is None:
+        stored = select_stored_dataset(session)
+        if stored is None:
+            return
+        source_id, name = stored, datasets.store.info(stored)["name"] or stored
+    else:
+        if streaming and not uploaded_file.name.lower().endswith(".parquet"):
+            upload_streamed_dataset(session, uploaded_file)
+            return
+        source_id, name = _source_id(uploaded_file), uploaded_file.name
+
+    if getattr(session, "source_id", None) != source_id or not hasattr(session, "df"):
+        session.df = datasets.open(stored) if uploaded_file is None else datasets.load(uploaded_file)
+        session.source_id = source_id
+        datasets.claim(fingerprint(session.df), owner_token(session))
+        seasonal_baseline(session.df)
+        column_summary(session.df)
+        city_counts(session.df)
+        session.appended_sources = set()
+        if hasattr(session, "streamed"):
+            del session.streamed
+
+    append_observations(session)
+    df = session.df
+    st.success("Данные успешно загружены!")
+
+    st.markdown(f"- Столбцы: **{df.columns.tolist()}**")
+    st.markdown(f"- Всего строк: `{len(df)}`")
+    st.markdown(f"- Объем в памяти: `{column_summary(df)['memory_mb'].sum():.2f} МБ`")
+    download_parquet(session, df, name)
+    display_dataset_summary(df)
+    st.write(f"Данные `{name}`:")
+
+    st.markdown(
+        """
+        <style>
+            .main .block-container {
+                max-width: 100%;
+            }
+        </style>
+        """,
+        unsafe_allow_html=True,
+    )
+
+    display_paginated_preview(df)
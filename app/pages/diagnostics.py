@@ -0,0 +1,28 @@
+import streamlit as st
+from app.lazy import import_report
+from app.metrics import metrics
+
+
+def display_diagnostics():
+    """Свернутая панель с временем этапов текущего перезапуска, накопленной статистикой и счетчиками кэшей."""
+    with st.expander("⏱️ Диагностика производительности"):
+        elapsed = metrics.run_elapsed()
+        if elapsed is not None:
+            st.markdown(f"- Перезапуск скрипта: `{elapsed * 1000:.1f} мс`")
+
+        st.write("Этапы этого перезапуска:")
+        st.dataframe(metrics.run_timings(), hide_index=True)
+
+        st.write("Все этапы с начала работы сервера:")
+        st.dataframe(metrics.timings(), hide_index=True)
+
+        gauges = metrics.gauges()
+        if gauges:
+            st.write("Кэши:")
+            st.json(gauges)
+
+        st.write("Первый импорт модулей:")
+        st.dataframe(import_report(), hide_index=True)
+
+        st.download_button("Скачать метрики (Prometheus)", data=metrics.to_prometheus(),
+                           file_name="metrics.prom", mime="text/plain")
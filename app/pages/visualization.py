@@ -1,14 +1,26 @@
+import numpy as np
 import streamlit as st
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 from app.logging_config import LoggedSession
+from app.analysis import seasonal_profile
+from app.metrics import timed
+from app.cache import memoized
+from app.pages.data_analysis import correlation_figure, select_sections, select_time_window
+from app.downsampling import downsample_groups, time_window
+from app.trends import period_means, temperature_trends
 
 
 def display_seasonal_profiles(city_data, city):
     st.subheader("Сезонные профили температуры")
-    seasonal_data = city_data.groupby("season")["temperature"].agg(["mean", "std"]).reset_index()
+    st.plotly_chart(seasonal_profile_figure(city_data, city), use_container_width=True, key="seasonal_profiles")
 
+
+@memoized("visualization_seasonal_profile_figure")
+@timed("figure")
+def seasonal_profile_figure(city_data, city):
+    seasonal_data = seasonal_profile(city_data)
     fig = go.Figure()
     fig.add_trace(
         go.Bar(
@@ -23,29 +35,99 @@ def display_seasonal_profiles(city_data, city):
         xaxis_title="Сезон",
         yaxis_title="Средняя температура (°C)",
     )
-    st.plotly_chart(fig, use_container_width=True, key="seasonal_profiles")
+    return fig
+
+
+@memoized("day_month_heatmap")
+@timed("groupby")
+def day_month_heatmap(city_data):
+    timestamps = pd.to_datetime(city_data["timestamp"])
+    return city_data["temperature"].groupby(
+        [timestamps.dt.month.rename("month"), timestamps.dt.day.rename("day")]
+    ).mean().unstack()
+
+
+@memoized("comparison_data")
+def comparison_data(df, cities):
+    return df[df["city"].isin(cities)]
+
+
+@memoized("comparison_series")
+def comparison_series(df, cities, start=None, end=None):
+    data = comparison_data(df, cities)
+    if start is not None:
+        data = time_window(data, start, end)
+    return downsample_groups(data, "city", "timestamp", "temperature")
 
 
-def display_temperature_trends(city_data):
+def display_temperature_trends(data, city):
+    """Тренд выбранного города и, если в `data` несколько городов, рейтинг самых быстро теплеющих."""
     st.subheader("Тренды температуры")
-    city_data["year"] = pd.to_datetime(city_data["timestamp"]).dt.year
-    yearly_trend = city_data.groupby("year")["temperature"].mean().reset_index()
-    fig = px.line(yearly_trend, x="year", y="temperature", title="Средняя температура по годам")
-    st.plotly_chart(fig, use_container_width=True, key="temperature_trends")
+    freq = st.radio("Шаг", list(TREND_STEPS), format_func=TREND_STEPS.get, horizontal=True, key="trend_freq",
+                    help="Для месячного шага наклон оценивается по отклонениям от нормы каждого месяца.")
+    trends = temperature_trends(data, freq)
+    row = trends.set_index("city").loc[city]
+    st.markdown(f"- Линейный тренд: `{row['slope']:+.2f} °C за 10 лет` "
+                f"(95% ДИ: `{row['ci_low']:+.2f}` … `{row['ci_high']:+.2f}`, периодов: `{row['periods']}`)")
+    st.plotly_chart(temperature_trends_figure(data, city, freq), use_container_width=True, key="temperature_trends")
+
+    if len(trends) > 1:
+        st.subheader("Быстрее всего теплеющие города")
+        top = st.number_input("Городов в рейтинге", min_value=1, max_value=len(trends), value=min(10, len(trends)),
+                              key="warming_top")
+        ranking = trends.sort_values("slope", ascending=False).head(int(top))
+        st.plotly_chart(warming_ranking_figure(ranking), use_container_width=True, key="warming_ranking")
+        st.dataframe(ranking, hide_index=True, width=1000)
+
+
+@memoized("temperature_trends_figure")
+@timed("figure")
+def temperature_trends_figure(data, city, freq="year"):
+    means = period_means(data, "year")
+    means = means[means["city"] == city]
+    slope = temperature_trends(data, freq).set_index("city").loc[city, "slope"] / 10
+    years = means["period"].dt.year.to_numpy(dtype=np.float64)
+    # МНК-прямая проходит через центр масс точек, поэтому ее можно провести по наклону без свободного члена.
+    line = means["temperature"].mean() + slope * (years - years.mean())
+
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=years, y=means["temperature"], mode="lines+markers", name="Среднегодовая"))
+    fig.add_trace(go.Scatter(x=years, y=line, mode="lines", name="Тренд", line=dict(dash="dash")))
+    fig.update_layout(title=f"Средняя температура по годам в городе {city}",
+                      xaxis_title="Год", yaxis_title="Температура (°C)")
+    return fig
+
+
+@memoized("warming_ranking_figure")
+@timed("figure")
+def warming_ranking_figure(ranking):
+    ranking = ranking.iloc[::-1]
+    fig = go.Figure(go.Bar(
+        x=ranking["slope"], y=ranking["city"], orientation="h",
+        error_x=dict(type="data", array=ranking["ci_high"] - ranking["slope"],
+                     arrayminus=ranking["slope"] - ranking["ci_low"]),
+    ))
+    fig.update_layout(title="Тренд температуры, °C за 10 лет (с 95% доверительным интервалом)",
+                      xaxis_title="°C за 10 лет", height=max(300, 30 * len(ranking)))
+    return fig
 
 
 def display_temperature_distribution(city_data):
     st.subheader("Распределение температуры")
-    fig = px.histogram(city_data, x="temperature", nbins=30, title="Распределение температуры")
-    st.plotly_chart(fig, use_container_width=True, key="temperature_distribution")
+    st.plotly_chart(temperature_distribution_figure(city_data), use_container_width=True,
+                    key="temperature_distribution")
+
+
+@memoized("temperature_distribution_figure")
+@timed("figure")
+def temperature_distribution_figure(city_data):
+    return px.histogram(city_data, x="temperature", nbins=30, title="Распределение температуры")
 
 
 def display_correlation_analysis(city_data):
     if "humidity" in city_data.columns and "pressure" in city_data.columns:
         st.subheader("Корреляция температуры с другими параметрами")
-        corr_matrix = city_data[["temperature", "humidity", "pressure"]].corr()
-        fig = px.imshow(corr_matrix, text_auto=True, title="Матрица корреляции")
-        st.plotly_chart(fig, use_container_width=True, key="correlation_analysis")
+        st.plotly_chart(correlation_figure(city_data), use_container_width=True, key="correlation_analysis")
 
 
 def display_extreme_temperatures(city_data):
@@ -63,53 +145,97 @@ def display_extreme_temperatures(city_data):
 
 def display_heatmap_by_day_month(city_data, city):
     st.subheader("Тепловая карта температуры по дням и месяцам")
-    city_data["month"] = pd.to_datetime(city_data["timestamp"]).dt.month
-    city_data["day"] = pd.to_datetime(city_data["timestamp"]).dt.day
-    heatmap_data = city_data.groupby(["month", "day"])["temperature"].mean().unstack()
-    fig = px.imshow(heatmap_data, labels=dict(x="День", y="Месяц", color="Температура (°C)"),
-                    title=f"Температура в городе {city} по дням и месяцам")
-    st.plotly_chart(fig, use_container_width=True, key="heatmap_day_month")
+    st.plotly_chart(heatmap_figure(city_data, city), use_container_width=True, key="heatmap_day_month")
+
+
+@memoized("heatmap_figure")
+@timed("figure")
+def heatmap_figure(city_data, city):
+    return px.imshow(day_month_heatmap(city_data), labels=dict(x="День", y="Месяц", color="Температура (°C)"),
+                     title=f"Температура в городе {city} по дням и месяцам")
 
 
 def display_boxplot_by_season(city_data, city):
     st.subheader("Распределение температуры по сезонам (Boxplot)")
-    fig = px.box(city_data, x="season", y="temperature", title=f"Распределение температуры по сезонам в городе {city}")
-    st.plotly_chart(fig, use_container_width=True, key="boxplot_by_season")
+    st.plotly_chart(boxplot_figure(city_data, city), use_container_width=True, key="boxplot_by_season")
+
+
+@memoized("boxplot_figure")
+@timed("figure")
+def boxplot_figure(city_data, city):
+    return px.box(city_data, x="season", y="temperature", title=f"Распределение температуры по сезонам в городе {city}")
 
 
 def display_comparison_between_cities(df):
     st.subheader("Сравнение температуры между городами")
     cities = st.multiselect("Выберите города для сравнения", df["city"].unique(), default=df["city"].unique()[:2])
     if len(cities) >= 2:
-        comparison_data = df[df["city"].isin(cities)]
-        fig = px.line(comparison_data, x="timestamp", y="temperature", color="city",
-                      title="Сравнение температуры между городами")
+        start, end = select_time_window(comparison_data(df, tuple(cities)), key="comparison_window",
+                                        per="графике каждого города")
+        st.plotly_chart(comparison_figure(df, tuple(cities), start, end), use_container_width=True,
+                        key="comparison_between_cities")
+    else:
+        st.warning("Выберите как минимум два города для сравнения.")
+
+
+@memoized("comparison_figure")
+@timed("figure")
+def comparison_figure(df, cities, start=None, end=None):
+    return px.line(comparison_series(df, cities, start, end), x="timestamp", y="temperature", color="city",
+                   title="Сравнение температуры между городами")
+
+
+def display_yearly_comparison_between_cities(yearly_means):
+    st.subheader("Сравнение среднегодовой температуры между городами")
+    all_cities = yearly_means["city"].unique()
+    cities = st.multiselect("Выберите города для сравнения", all_cities, default=all_cities[:2])
+    if len(cities) >= 2:
+        fig = px.line(yearly_means[yearly_means["city"].isin(cities)], x="year", y="temperature", color="city",
+                      title="Сравнение среднегодовой температуры между городами")
         st.plotly_chart(fig, use_container_width=True, key="comparison_between_cities")
     else:
         st.warning("Выберите как минимум два города для сравнения.")
 
 
+SECTIONS = {
+    "Сравнение городов": None,
+    "Сезонные профили": display_seasonal_profiles,
+    "Тренды": display_temperature_trends,
+    "Распределение": lambda city_data, city: display_temperature_distribution(city_data),
+    "Корреляция": lambda city_data, city: display_correlation_analysis(city_data),
+    "Экстремальные температуры": lambda city_data, city: display_extreme_temperatures(city_data),
+    "Тепловая карта": display_heatmap_by_day_month,
+    "Boxplot по сезонам": display_boxplot_by_season,
+}
+DEFAULT_SECTIONS = ["Сравнение городов", "Сезонные профили"]
+TREND_STEPS = {"year": "Годы", "month": "Месяцы"}
+
+
 def visualize_data(session: LoggedSession):
     st.header("📈 Визуализация")
     st.info("Здесь представлен расширенный анализ загруженного набора данных.")
 
-    if not hasattr(session, "df"):
+    if hasattr(session, "df"):
+        df = session.df
+        city = st.selectbox("Выберите город", df["city"].unique(), key="city_selectbox_visualization")
+        with timed("filter"):
+            city_data = df[df["city"] == city].copy()
+    elif hasattr(session, "streamed"):
+        stream = session.streamed
+        city = st.selectbox("Выберите город", stream.cities, key="city_selectbox_visualization")
+        city_data = stream.city_frame(city)
+    else:
         st.warning("Загрузите данные на вкладке '📁 Загрузка данных'.")
         return
 
-    df = session.df
-
-    city = st.selectbox("Выберите город", df["city"].unique(), key="city_selectbox_visualization")
-    city_data = df[df["city"] == city].copy()
-
-    threshold = city_data["temperature"].quantile(0.9)
-    city_data.loc[:, "is_anomaly"] = city_data["temperature"] > threshold
-
-    display_comparison_between_cities(df)
-    display_seasonal_profiles(city_data, city)
-    display_temperature_trends(city_data)
-    display_temperature_distribution(city_data)
-    display_correlation_analysis(city_data)
-    display_extreme_temperatures(city_data)
-    display_heatmap_by_day_month(city_data, city)
-    display_boxplot_by_season(city_data, city)
\ No newline at end of file
+    sections = select_sections(SECTIONS, DEFAULT_SECTIONS, key="visualization_sections")
+    for name in sections:
+        if name == "Сравнение городов":
+            if hasattr(session, "df"):
+                display_comparison_between_cities(df)
+            else:
+                display_yearly_comparison_between_cities(stream.aggregates.yearly_means())
+        elif name == "Тренды" and hasattr(session, "df"):
+            display_temperature_trends(df, city)
+        else:
+            SECTIONS[name](city_data, city)
\ No newline at end of file
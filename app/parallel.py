@@ -0,0 +1,86 @@
+import atexit
+import os
+from multiprocessing import get_context, shared_memory
+import numpy as np
+from app.analysis import analyze_kernel, split_groups
+
+
+__all__ = ['PARALLEL_MIN_ROWS', 'get_pool', 'shutdown_pool', 'should_parallelize', 'shared_memory_kernel']
+
+
+PARALLEL_MIN_ROWS = int(os.environ.get("ANALYSIS_PARALLEL_MIN_ROWS", 2_000_000))
+BATCHES_PER_WORKER = 4
+
+_pool = None
+_pool_size = 0
+
+
+def get_pool():
+    """Возвращает пул процессов, создаваемый один раз на процесс сервера."""
+    global _pool, _pool_size
+    if _pool is None:
+        _pool_size = os.cpu_count() or 1
+        _pool = get_context("spawn").Pool(processes=_pool_size)
+        atexit.register(shutdown_pool)
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.terminate()
+        _pool.join()
+        _pool = None
+
+
+def should_parallelize(n_rows, n_groups, min_rows=None):
+    min_rows = PARALLEL_MIN_ROWS if min_rows is None else min_rows
+    return n_groups > 1 and n_rows >= min_rows and (os.cpu_count() or 1) > 1
+
+
+def _analyze_shared_batch(task):
+    names, n_rows, lo, hi, starts, ends, window, std_dev_factor = task
+    blocks = [shared_memory.SharedMemory(name=name) for name in names]
+    try:
+        values = np.ndarray(n_rows, dtype=np.float64, buffer=blocks[0].buf)
+        moving_avg = np.ndarray(n_rows, dtype=np.float64, buffer=blocks[1].buf)
+        is_anomaly = np.ndarray(n_rows, dtype=np.bool_, buffer=blocks[2].buf)
+        moving_avg[lo:hi], is_anomaly[lo:hi] = analyze_kernel(values[lo:hi], starts, ends, window, std_dev_factor)
+        del values, moving_avg, is_anomaly
+    finally:
+        for block in blocks:
+            block.close()
+    return hi - lo
+
+
+def shared_memory_kernel(values, starts, ends, window=30, std_dev_factor=2, min_rows=None):
+    """Параллельный вычислитель для `analyze_cities`.
+
+    Столбец температур передается воркерам через разделяемую память, каждая задача
+    обрабатывает пакет подряд идущих городов. На небольших наборах данных считает в текущем процессе.
+    """
+    n_rows = len(values)
+    if not should_parallelize(n_rows, len(starts), min_rows):
+        return analyze_kernel(values, starts, ends, window, std_dev_factor)
+
+    pool = get_pool()
+    blocks = [
+        shared_memory.SharedMemory(create=True, size=max(n_rows * itemsize, 1))
+        for itemsize in (8, 8, 1)
+    ]
+    try:
+        np.ndarray(n_rows, dtype=np.float64, buffer=blocks[0].buf)[:] = values
+        names = [block.name for block in blocks]
+        tasks = [
+            (names, n_rows, lo, hi, batch_starts, batch_ends, window, std_dev_factor)
+            for lo, hi, batch_starts, batch_ends in split_groups(starts, ends, _pool_size * BATCHES_PER_WORKER)
+        ]
+        pool.map(_analyze_shared_batch, tasks)
+
+        moving_avg = np.ndarray(n_rows, dtype=np.float64, buffer=blocks[1].buf).copy()
+        is_anomaly = np.ndarray(n_rows, dtype=np.bool_, buffer=blocks[2].buf).copy()
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+    return moving_avg, is_anomaly
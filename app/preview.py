@@ -0,0 +1,58 @@
+import math
+import numpy as np
+import pandas as pd
+from app.cache import fingerprint, memoized, result_cache
+
+
+__all__ = ['PAGE_SIZES', 'page_count', 'preview_page', 'column_summary', 'city_counts', 'append_summaries']
+
+
+PAGE_SIZES = (50, 100, 500, 1000)
+
+
+def page_count(n_rows, page_size):
+    return max(1, math.ceil(n_rows / page_size))
+
+
+def preview_page(df, page, page_size):
+    """Страница `page` (с единицы) набора данных: срез фрейма без копирования всего набора.
+
+    В Arrow `st.dataframe` преобразует только эту страницу.
+    """
+    offset = (min(max(page, 1), page_count(len(df), page_size)) - 1) * page_size
+    return df.iloc[offset:offset + page_size]
+
+
+@memoized("column_summary")
+def column_summary(df):
+    """Тип, число пропусков и объем в памяти для каждого столбца."""
+    nulls = df.isna().sum()
+    return pd.DataFrame({
+        "column": df.columns,
+        "dtype": df.dtypes.astype(str).to_numpy(),
+        "non_null": (len(df) - nulls).to_numpy(),
+        "nulls": nulls.to_numpy(),
+        "memory_mb": df.memory_usage(deep=True, index=False).to_numpy() / 2 ** 20,
+    })
+
+
+@memoized("city_counts")
+def city_counts(df):
+    counts = df["city"].value_counts(sort=False, dropna=False)
+    return counts.rename_axis("city").reset_index(name="rows").astype({"rows": np.int64})
+
+
+def append_summaries(df, rows, combined):
+    """Кладет в кэш сводку столбцов и счетчики городов набора `combined` (это `df` с дописанными `rows`),
+    складывая сводки частей вместо прохода по всему набору.
+    """
+    old, new = column_summary(df).set_index("column"), column_summary(rows).set_index("column")
+    summary = old[["non_null", "nulls", "memory_mb"]].add(new[["non_null", "nulls", "memory_mb"]], fill_value=0)
+    summary = summary.reindex(combined.columns).astype({"non_null": np.int64, "nulls": np.int64})
+    summary.insert(0, "dtype", combined.dtypes.astype(str).to_numpy())
+    result_cache.put(("column_summary", fingerprint(combined)), summary.rename_axis("column").reset_index())
+
+    counts = pd.concat([
+        city_counts(part).astype({"city": object}).set_index("city")["rows"] for part in (df, rows)
+    ]).groupby(level=0, sort=False, dropna=False).sum()
+    result_cache.put(("city_counts", fingerprint(combined)), counts.rename_axis("city").reset_index(name="rows"))
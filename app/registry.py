@@ -0,0 +1,211 @@
+import hashlib
+import logging
+import os
+import threading
+import weakref
+from collections import OrderedDict
+import numpy as np
+from app.cache import fingerprint
+from app.ingest import load_dataset
+from app.logging_config import LoggedSession
+from app.metrics import metrics
+from app.store import DatasetStore
+
+
+__all__ = ['DATASET_STORE_DIR', 'DatasetRegistry', 'DatasetHandle', 'UserSession', 'datasets']
+
+
+# В Docker путь задается переменной окружения и указывает на том; пустое значение отключает хранилище.
+DATASET_STORE_DIR = os.environ.get("DATASET_STORE_DIR", "cache/datasets")
+
+logger = logging.getLogger("app.datasets")
+
+
+def _frame_bytes(df):
+    return int(np.sum(df.memory_usage(deep=True)))
+
+
+def _file_digest(uploaded_file):
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(uploaded_file.getvalue() if hasattr(uploaded_file, "getvalue") else uploaded_file.read())
+    if hasattr(uploaded_file, "seek"):
+        uploaded_file.seek(0)
+    return digest.hexdigest()
+
+
+class DatasetHandle:
+    """Ссылка сессии на набор данных в реестре: пока ссылка жива, набор не вытесняется."""
+
+    def __init__(self, registry, key):
+        self.registry = registry
+        self.key = key
+        registry._acquire(key)
+        weakref.finalize(self, registry._release, key)
+
+    @property
+    def df(self):
+        return self.registry.get(self.key)
+
+
+class DatasetRegistry:
+    """Общие для всех сессий загруженные наборы данных, по одной копии на содержимое.
+
+    Наборы ключуются хэшем содержимого и считаются неизменяемыми: дозапись строк дает новый набор.
+    Когда суммарный объем превышает `max_bytes`, вытесняются давно не использовавшиеся наборы,
+    на которые не ссылается ни одна сессия.
+
+    С хранилищем `store` загруженные файлы сохраняются на диск и открываются оттуда через отображение
+    в память: такие наборы не занимают кучу процесса (в объеме не учитываются) и переживают перезапуск.
+    """
+
+    def __init__(self, max_bytes, store=None):
+        self.max_bytes = max_bytes
+        self.store = store
+        self._entries = OrderedDict()
+        self._refs = {}
+        self._aliases = {}
+        self._size = 0
+        self._lock = threading.RLock()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def size(self):
+        return self._size
+
+    @property
+    def handles(self):
+        return sum(self._refs.values())
+
+    def get(self, key):
+        with self._lock:
+            self._entries.move_to_end(key)
+            return self._entries[key][0]
+
+    def _put(self, df, size=None):
+        key = fingerprint(df)
+        with self._lock:
+            if key not in self._entries:
+                size = _frame_bytes(df) if size is None else size
+                self._entries[key] = (df, size)
+                self._size += size
+                self._evict(keep=key)
+            self._entries.move_to_end(key)
+        return key
+
+    def register(self, df):
+        """Кладет набор в реестр (или находит уже загруженную копию) и возвращает ссылку на него."""
+        with self._lock:
+            return DatasetHandle(self, self._put(df))
+
+    def load(self, uploaded_file, loader=load_dataset):
+        """Загружает файл, не разбирая повторно файлы, содержимое которых уже есть в реестре или хранилище."""
+        digest = _file_digest(uploaded_file)
+        with self._lock:
+            key = self._aliases.get(digest)
+            if key in self._entries:
+                return self.get(key)
+        key = self.store.find(digest) if self.store is not None else None
+        if key is not None:
+            df = self.open(key)
+        else:
+            df = loader(uploaded_file)
+            if self.store is not None:
+                name = getattr(uploaded_file, "name", None)
+                try:
+                    self.store.save(df, fingerprint(df), name=name, source=digest)
+                except (OSError, TypeError, ValueError) as error:
+                    logger.warning("Набор %s не сохранен в хранилище %s: %s", name, self.store.root, error)
+                else:
+                    df = self.open(fingerprint(df))
+            key = self._put(df)
+        with self._lock:
+            self._aliases[digest] = key
+            return self._entries[key][0] if key in self._entries else df
+
+    def open(self, key):
+        """Набор по ключу: из памяти, а если его там нет — из хранилища."""
+        with self._lock:
+            if key in self._entries:
+                return self.get(key)
+        df = self.store.open(key)
+        self._put(df, size=0)
+        return df
+
+    def save_analysis(self, key, analysis):
+        if self.store is not None:
+            self.store.save_analysis(key, analysis)
+
+    def claim(self, key, owner):
+        """Отмечает сохраненный набор как загруженный владельцем `owner`."""
+        if self.store is not None and key in self.store:
+            self.store.claim(key, owner)
+
+    def owned(self, owner):
+        """Ключи сохраненных наборов, которые загружал `owner`."""
+        return self.store.owned(owner) if self.store is not None else []
+
+    def _acquire(self, key):
+        with self._lock:
+            self._refs[key] = self._refs.get(key, 0) + 1
+
+    def _release(self, key):
+        with self._lock:
+            self._refs[key] -= 1
+            if not self._refs[key]:
+                del self._refs[key]
+            self._evict()
+
+    def _evict(self, keep=None):
+        evicted = False
+        for key in [key for key in self._entries if key not in self._refs and key != keep]:
+            if self._size <= self.max_bytes:
+                break
+            self._size -= self._entries.pop(key)[1]
+            evicted = True
+        if evicted:
+            self._aliases = {digest: key for digest, key in self._aliases.items() if key in self._entries}
+
+    def clear(self):
+        with self._lock:
+            for key in [key for key in self._entries if key not in self._refs]:
+                self._size -= self._entries.pop(key)[1]
+            self._aliases = {digest: key for digest, key in self._aliases.items() if key in self._entries}
+
+
+_store_max_bytes = int(os.environ.get("DATASET_STORE_MAX_BYTES", 20 * 2 ** 30))
+datasets = DatasetRegistry(
+    int(os.environ.get("DATASET_REGISTRY_MAX_BYTES", 2 * 2 ** 30)),
+    DatasetStore(DATASET_STORE_DIR, _store_max_bytes) if DATASET_STORE_DIR else None,
+)
+metrics.gauge("datasets_loaded", lambda: len(datasets))
+metrics.gauge("datasets_bytes", lambda: datasets.size)
+metrics.gauge("datasets_handles", lambda: datasets.handles)
+
+
+class UserSession(LoggedSession):
+    """Состояние одного пользователя: HTTP-клиент и ссылка на набор данных в общем реестре `datasets`."""
+
+    def __init__(self, registry=datasets):
+        super().__init__()
+        self.registry = registry
+        self._handle = None
+
+    @property
+    def df(self):
+        if self._handle is None:
+            raise AttributeError("df")
+        return self._handle.df
+
+    @df.setter
+    def df(self, value):
+        self._handle = self.registry.register(value)
+
+    @df.deleter
+    def df(self):
+        self._handle = None
@@ -1,19 +1,180 @@
+import asyncio
+import atexit
+import hashlib
+import os
+import threading
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from app.cache import TTLCache
+from app.logging_config import LoggedSession
+from app.metrics import timed
 
 
 __all__ = ['OpenWeatherMapClient']
 
 
+DEFAULT_BASE_URL = "https://api.openweathermap.org/data/2.5/weather"
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# OpenWeatherMap обновляет текущую погоду не чаще раза в 10 минут.
+RESPONSE_TTL = 600
+KEY_CHECK_TTL = 3600
+INVALID_KEY_TTL = 60
+
+
+def _cache_key(city, units):
+    return f"{city.strip().lower()}|{units}"
+
+
+def _key_digest(api_key):
+    return hashlib.sha256(api_key.encode()).hexdigest()
+
+
 class OpenWeatherMapClient:
-    def __init__(self, api_key):
+    """Единый HTTP-слой к OpenWeatherMap: пул соединений для синхронных и асинхронных запросов и TTL-кэш.
+
+    Адрес API задается параметром `base_url` или переменной окружения `OWM_BASE_URL`,
+    например, для работы с локальной заглушкой `app.settings.stub_server`.
+    """
+
+    def __init__(self, api_key=None, base_url=None, max_concurrency=20, timeout=10, retries=3, backoff=0.5,
+                 keepalive_timeout=60, cache_ttl=RESPONSE_TTL, cache_path=None):
         self.api_key = api_key
-        self.base_url = "https://api.openweathermap.org/data/2.5/weather"
-
-    def get_current_temperature(self, city, api_key):
-        url = f'http://api.openweathermap.org/data/2.5/weather?q={city}&units=metric&appid={api_key}'
-        response = requests.get(url)
-        if response.status_code == 200:
-            data = response.json()
-            return data['main']['temp']
-        else:
-            return None
+        self.base_url = base_url or os.environ.get("OWM_BASE_URL", DEFAULT_BASE_URL)
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.keepalive_timeout = keepalive_timeout
+        cache_path = cache_path or os.environ.get("OWM_CACHE_PATH")
+        self.cache = TTLCache(cache_ttl, path=cache_path)
+        self.key_checks = TTLCache(KEY_CHECK_TTL)
+        self.http = self._create_http_session()
+        self._loop = None
+        self._session = None
+        self._lock = threading.Lock()
+
+    def _create_http_session(self):
+        session = LoggedSession()
+        retry = Retry(
+            total=self.retries,
+            backoff_factor=self.backoff,
+            status_forcelist=sorted(RETRY_STATUSES),
+            allowed_methods=["GET"],
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_concurrency, max_retries=retry)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def _params(self, city, api_key, units):
+        return {"q": city, "units": units, "appid": api_key or self.api_key}
+
+    def _fetch(self, city, api_key, units):
+        """Возвращает (код ответа, температура); код None означает сетевую ошибку."""
+        try:
+            response = self.http.get(self.base_url, params=self._params(city, api_key, units), timeout=self.timeout)
+        except requests.RequestException:
+            return None, None
+        if response.status_code != 200:
+            return response.status_code, None
+        temperature = response.json()['main']['temp']
+        self.cache.set(_cache_key(city, units), temperature)
+        return response.status_code, temperature
+
+    def get_current_temperature(self, city, api_key=None, units="metric"):
+        cached = self.cache.get(_cache_key(city, units))
+        if cached is not None:
+            return cached
+        return self._fetch(city, api_key, units)[1]
+
+    def check_api_key(self, api_key):
+        """Проверяет ключ запросом погоды в Лондоне; результат проверки кэшируется."""
+        digest = _key_digest(api_key)
+        cached = self.key_checks.get(digest)
+        if cached is not None:
+            return cached
+        status, _ = self._fetch("London", api_key, "metric")
+        if status is None:
+            return False
+        is_valid = status == 200
+        self.key_checks.set(digest, is_valid, ttl=KEY_CHECK_TTL if is_valid else INVALID_KEY_TTL)
+        return is_valid
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="owm-client", daemon=True).start()
+                atexit.register(self.close)
+        return self._loop
+
+    async def _get_session(self):
+        import aiohttp
+
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_concurrency, keepalive_timeout=self.keepalive_timeout),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return self._session
+
+    def submit(self, coro):
+        """Запускает корутину в фоновом цикле событий клиента, где живет общий пул соединений."""
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+
+    async def fetch_temperature_async(self, city, api_key=None, units="metric"):
+        """Температура в городе с повторами и экспоненциальной задержкой; None при ошибке."""
+        import aiohttp
+
+        cached = self.cache.get(_cache_key(city, units))
+        if cached is not None:
+            return cached
+        session = await self._get_session()
+        params = self._params(city, api_key, units)
+        for attempt in range(self.retries + 1):
+            try:
+                with timed("http"):
+                    async with session.get(self.base_url, params=params) as response:
+                        status = response.status
+                        data = await response.json(content_type=None) if status == 200 else None
+                if status == 200:
+                    # Запись на диск здесь блокировала бы цикл событий: файл сохраняется один раз после пакета.
+                    self.cache.set(_cache_key(city, units), data['main']['temp'], persist=False)
+                    return data['main']['temp']
+                if status not in RETRY_STATUSES:
+                    return None
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                pass
+            if attempt < self.retries:
+                await asyncio.sleep(self.backoff * 2 ** attempt)
+        return None
+
+    async def _fetch_many(self, cities, api_key):
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def fetch(city):
+            async with semaphore:
+                return await self.fetch_temperature_async(city, api_key)
+
+        return await asyncio.gather(*(fetch(city) for city in cities))
+
+    def get_current_temperatures(self, cities, api_key=None):
+        """Текущая температура для всех городов одним пакетом конкурентных запросов."""
+        cities = list(cities)
+        temperatures = self.submit(self._fetch_many(cities, api_key)).result()
+        self.cache.flush()
+        return dict(zip(cities, temperatures))
+
+    def close(self):
+        self.cache.flush()
+        self.http.close()
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if loop is None:
+            return
+        if self._session is not None:
+            asyncio.run_coroutine_threadsafe(self._session.close(), loop).result(timeout=self.timeout)
+            self._session = None
+        loop.call_soon_threadsafe(loop.stop)
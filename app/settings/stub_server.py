@@ -0,0 +1,131 @@
+import argparse
+import json
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+__all__ = ['FakeOpenWeatherMapServer', 'fake_temperature']
+
+
+WEATHER_PATH = "/data/2.5/weather"
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+
+def fake_temperature(city):
+    """Детерминированная «текущая» температура для города: одинакова между запусками."""
+    return round(zlib.crc32(city.strip().lower().encode()) % 500 / 10 - 10, 1)
+
+
+class FakeOpenWeatherMapServer:
+    """Локальная заглушка эндпоинта текущей погоды OpenWeatherMap для тестов и бенчмарков без сети.
+
+    `latency` — искусственная задержка ответа в секундах, `api_key` — единственный принимаемый ключ
+    (по умолчанию принимается любой), `failures` — сколько раз подряд отвечать 503 для города,
+    `unknown_cities` — города, для которых возвращается 404.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, api_key=None, failures=None, unknown_cities=()):
+        self.latency = latency
+        self.api_key = api_key
+        self.failures = dict(failures or {})
+        self.unknown_cities = {city.lower() for city in unknown_cities}
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = _Server((host, port), self._handler())
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}{WEATHER_PATH}"
+
+    def _respond(self, path):
+        url = urlparse(path)
+        if url.path != WEATHER_PATH:
+            return 404, {"cod": "404", "message": "Internal error"}
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        city = params.get("q", "")
+        with self._lock:
+            self.requests += 1
+            if self.failures.get(city):
+                self.failures[city] -= 1
+                return 503, {"cod": "503", "message": "Service unavailable"}
+        if not params.get("appid") or (self.api_key is not None and params["appid"] != self.api_key):
+            return 401, {"cod": 401, "message": "Invalid API key. Please see https://openweathermap.org/faq#error401"}
+        if not city or city.lower() in self.unknown_cities:
+            return 404, {"cod": "404", "message": "city not found"}
+
+        temperature = fake_temperature(city)
+        if params.get("units") == "imperial":
+            temperature = round(temperature * 9 / 5 + 32, 2)
+        elif params.get("units") != "metric":
+            temperature = round(temperature + 273.15, 2)
+        return 200, {"name": city, "main": {"temp": temperature}, "cod": 200}
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                if stub.latency:
+                    time.sleep(stub.latency)
+                status, body = stub._respond(self.path)
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-owm", daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальная заглушка OpenWeatherMap API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка ответа, секунды")
+    args = parser.parse_args()
+
+    server = FakeOpenWeatherMapServer(args.host, args.port, latency=args.latency)
+    print(f"Заглушка OpenWeatherMap запущена: {server.base_url} (OWM_BASE_URL)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._server.server_close()
+
+
+if __name__ == "__main__":
+    main()
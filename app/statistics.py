@@ -0,0 +1,122 @@
+import numpy as np
+import pandas as pd
+from app.cache import memoized
+from app.metrics import timed
+
+
+__all__ = ['group_codes', 'sorted_groups', 'grouped_quantiles', 'seasonal_statistics', 'moment_statistics', 'yearly_means']
+
+
+def group_codes(df, by):
+    """Коды групп в порядке сортировки ключей (как у groupby) и сами ключи с размерами групп."""
+    grouped = df.groupby(list(by), observed=True, sort=True)
+    return grouped.ngroup().to_numpy(), grouped.size()
+
+
+def sorted_groups(values, codes, n_groups):
+    """Сортирует значения внутри групп одним lexsort; пропуски и строки без группы отбрасываются.
+
+    Возвращает отсортированные значения и границы групп в них.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    valid = (codes >= 0) & ~np.isnan(values)
+    values, codes = values[valid], codes[valid]
+    order = np.lexsort((values, codes))
+    counts = np.bincount(codes, minlength=n_groups)
+    ends = np.cumsum(counts)
+    return values[order], ends - counts, ends
+
+
+def grouped_quantiles(sorted_values, starts, ends, quantiles):
+    """Квантили с линейной интерполяцией (как у pandas) для всех групп сразу, форма (группы, квантили)."""
+    lengths = ends - starts
+    positions = np.multiply.outer(np.maximum(lengths - 1, 0), np.asarray(quantiles, dtype=np.float64))
+    lower = np.floor(positions).astype(np.int64)
+    upper = np.minimum(lower + 1, np.maximum(lengths - 1, 0)[:, None])
+    fraction = positions - lower
+    if len(sorted_values) == 0:
+        return np.full(positions.shape, np.nan)
+    base = starts[:, None]
+    low_values = sorted_values[np.minimum(base + lower, len(sorted_values) - 1)]
+    high_values = sorted_values[np.minimum(base + upper, len(sorted_values) - 1)]
+    result = low_values + (high_values - low_values) * fraction
+    result[lengths == 0] = np.nan
+    return result
+
+
+@memoized("seasonal_statistics")
+@timed("groupby")
+def seasonal_statistics(df, by=("city", "season")):
+    """Среднее, σ, медиана, квартили и число наблюдений температуры для всех групп за один проход."""
+    codes, sizes = group_codes(df, by)
+    n_groups = len(sizes)
+    values, starts, ends = sorted_groups(df["temperature"].to_numpy(dtype=np.float64, na_value=np.nan), codes, n_groups)
+
+    counts = ends - starts
+    group_ids = np.repeat(np.arange(n_groups), counts)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.bincount(group_ids, weights=values, minlength=n_groups) / counts
+        m2 = np.bincount(group_ids, weights=(values - mean[group_ids]) ** 2, minlength=n_groups)
+        std = np.sqrt(m2 / (counts - 1))
+    quartiles = grouped_quantiles(values, starts, ends, (0.25, 0.5, 0.75))
+
+    result = sizes.index.to_frame(index=False)
+    result["mean"] = mean
+    result["std"] = std
+    result["median"] = quartiles[:, 1]
+    result["q1"] = quartiles[:, 0]
+    result["q3"] = quartiles[:, 2]
+    result["count"] = sizes.to_numpy()
+    return result
+
+
+@memoized("moment_statistics")
+@timed("groupby")
+def moment_statistics(df, by=("city",)):
+    """Число наблюдений, среднее, σ, минимум, квартили, максимум, скошенность и эксцесс температуры для всех групп.
+
+    Одна сортировка значений внутри групп дает квантили и экстремумы, а центральные моменты считаются
+    суммами по группам. Скошенность и эксцесс — смещенные оценки, как у `scipy.stats.skew` и `kurtosis`
+    по умолчанию (эксцесс по Фишеру); пропуски отбрасываются.
+    """
+    codes, sizes = group_codes(df, by)
+    n_groups = len(sizes)
+    values, starts, ends = sorted_groups(df["temperature"].to_numpy(dtype=np.float64, na_value=np.nan), codes, n_groups)
+
+    counts = ends - starts
+    group_ids = np.repeat(np.arange(n_groups), counts)
+    nonempty = counts > 0
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.bincount(group_ids, weights=values, minlength=n_groups) / counts
+        deviations = values - mean[group_ids]
+        squares = deviations ** 2
+        m2 = np.bincount(group_ids, weights=squares, minlength=n_groups) / counts
+        m3 = np.bincount(group_ids, weights=squares * deviations, minlength=n_groups) / counts
+        m4 = np.bincount(group_ids, weights=squares ** 2, minlength=n_groups) / counts
+        std = np.sqrt(m2 * counts / (counts - 1))
+        skewness = m3 / m2 ** 1.5
+        kurtosis = m4 / m2 ** 2 - 3
+    quartiles = grouped_quantiles(values, starts, ends, (0.25, 0.5, 0.75))
+    padded = values if len(values) else np.full(1, np.nan)
+    last = len(padded) - 1
+
+    result = sizes.index.to_frame(index=False)
+    result["count"] = counts
+    result["mean"] = mean
+    result["std"] = std
+    result["min"] = np.where(nonempty, padded[np.minimum(starts, last)], np.nan)
+    result["q1"] = quartiles[:, 0]
+    result["median"] = quartiles[:, 1]
+    result["q3"] = quartiles[:, 2]
+    result["max"] = np.where(nonempty, padded[np.clip(ends - 1, 0, last)], np.nan)
+    result["skewness"] = skewness
+    result["kurtosis"] = kurtosis
+    return result
+
+
+@memoized("yearly_means")
+@timed("groupby")
+def yearly_means(df):
+    """Среднегодовая температура по городам."""
+    years = pd.to_datetime(df["timestamp"]).dt.year.rename("year")
+    return df["temperature"].groupby([df["city"], years], observed=True).mean().reset_index()
@@ -0,0 +1,226 @@
+import json
+import os
+import shutil
+import threading
+import uuid
+from datetime import datetime
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from app.analysis import CityAnalysis
+from app.baseline import SeasonalBaseline, seasonal_baseline
+from app.cache import remember_fingerprint, result_cache
+from app.metrics import timed
+
+
+__all__ = ['DatasetStore', 'write_frame', 'read_frame']
+
+
+def _dtype_name(dtype):
+    return f"string[{dtype.storage}]" if isinstance(dtype, pd.StringDtype) else str(dtype)
+
+
+def write_frame(directory, df):
+    """Сохраняет фрейм по столбцам в `.npy`: категории, строки и прочие типы-расширения pandas — кодами
+    со словарем в columns.json, даты с часовым поясом — в UTC с поясом в columns.json.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    columns = []
+    for position, (name, column) in enumerate(df.items()):
+        entry = {"name": name}
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            values = column.cat.codes.to_numpy()
+            entry["categories"] = column.cat.categories.tolist()
+            entry["ordered"] = bool(column.cat.ordered)
+        elif isinstance(column.dtype, pd.DatetimeTZDtype):
+            values = column.dt.tz_convert("UTC").dt.tz_localize(None).to_numpy()
+            entry["tz"] = str(column.dt.tz)
+        elif column.dtype == object or isinstance(column.dtype, pd.api.extensions.ExtensionDtype):
+            values, uniques = pd.factorize(column)
+            entry["values"] = uniques.tolist()
+            if column.dtype != object:
+                entry["dtype"] = _dtype_name(column.dtype)
+        else:
+            values = column.to_numpy()
+        np.save(directory / f"{position}.npy", values, allow_pickle=False)
+        columns.append(entry)
+    if not df.index.equals(pd.RangeIndex(len(df))):
+        np.save(directory / "index.npy", df.index.to_numpy(), allow_pickle=False)
+    (directory / "columns.json").write_text(json.dumps(columns, ensure_ascii=False))
+
+
+def read_frame(directory):
+    """Открывает сохраненный `write_frame` фрейм через отображение файлов в память.
+
+    Числовые столбцы и коды категорий не копируются; код -1 (пропуск при факторизации) становится NaN или NA.
+    """
+    data = {}
+    for position, entry in enumerate(json.loads((directory / "columns.json").read_text())):
+        values = np.load(directory / f"{position}.npy", mmap_mode="r")
+        if "categories" in entry:
+            values = pd.Categorical.from_codes(values, categories=entry["categories"], ordered=entry["ordered"])
+        elif "tz" in entry:
+            values = pd.DatetimeIndex(values, tz="UTC").tz_convert(entry["tz"]).array
+        elif "dtype" in entry:
+            values = pd.array(entry["values"], dtype=entry["dtype"]).take(values, allow_fill=True)
+        elif "values" in entry:
+            values = np.asarray(entry["values"] + [np.nan], dtype=object)[values]
+        data[entry["name"]] = values
+    index_path = directory / "index.npy"
+    index = np.load(index_path, mmap_mode="r") if index_path.exists() else None
+    return pd.DataFrame(data, index=index, copy=False)
+
+
+def _disk_bytes(path):
+    return sum(file.stat().st_size for file in path.rglob("*") if file.is_file())
+
+
+class DatasetStore:
+    """Каталог обработанных наборов данных на диске, переживающий перезапуски приложения.
+
+    Каждый набор лежит в подкаталоге с именем отпечатка содержимого: типизированные столбцы, сезонная норма
+    и, когда анализ уже выполнялся, отсортированный по городам результат с границами городов.
+    Наборы открываются через отображение файлов в память: загрузка занимает миллисекунды,
+    а страницы файлов разделяются всеми процессами через кэш ОС.
+    Когда каталог занимает больше `max_bytes`, удаляются наборы, к которым дольше всего не обращались.
+    """
+
+    def __init__(self, root, max_bytes=None):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        return (self.root / key / "meta.json").exists()
+
+    def keys(self):
+        if not self.root.exists():
+            return []
+        return sorted(path.parent.name for path in self.root.glob("*/meta.json"))
+
+    def info(self, key):
+        return json.loads((self.root / key / "meta.json").read_text())
+
+    def find(self, source):
+        """Ключ набора, загруженного из файла с хэшем `source`, или None."""
+        for key in self.keys():
+            if source in self.info(key).get("sources", []):
+                return key
+        return None
+
+    def owned(self, owner):
+        """Ключи наборов, которые загружал владелец `owner`."""
+        return [key for key in self.keys() if owner in self.info(key).get("owners", [])]
+
+    def claim(self, key, owner):
+        self._update_meta(key, owner=owner)
+
+    def _update_meta(self, key, source=None, owner=None):
+        """Отмечает обращение к набору и добавляет в его описание хэш файла `source` и владельца `owner`."""
+        path = self.root / key / "meta.json"
+        with self._lock:
+            meta = json.loads(path.read_text())
+            meta["accessed"] = datetime.now().isoformat()
+            if source and source not in meta["sources"]:
+                meta["sources"].append(source)
+            if owner and owner not in meta.setdefault("owners", []):
+                meta["owners"].append(owner)
+            tmp_path = path.with_name(f".meta.{uuid.uuid4().hex}.tmp")
+            tmp_path.write_text(json.dumps(meta, ensure_ascii=False))
+            os.replace(tmp_path, path)
+
+    def _evict(self, keep=None):
+        if self.max_bytes is None:
+            return
+        sizes = {key: _disk_bytes(self.root / key) for key in self.keys()}
+        total = sum(sizes.values())
+        for key in sorted(sizes, key=lambda key: self.info(key).get("accessed", "")):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            tmp_path = self.root / f".{key}.{uuid.uuid4().hex}.tmp"
+            with self._lock:
+                os.replace(self.root / key, tmp_path)
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            total -= sizes[key]
+
+    def _write(self, key, write):
+        tmp_path = self.root / f".{key}.{uuid.uuid4().hex}.tmp"
+        try:
+            write(tmp_path)
+            with self._lock:
+                if key in self:
+                    return
+                os.replace(tmp_path, self.root / key)
+        finally:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+    @timed("store")
+    def save(self, df, key, name=None, source=None):
+        """Сохраняет набор и его сезонную норму; запись атомарна — каталог появляется целиком.
+
+        Если набор уже сохранен, в его описание только добавляется хэш файла `source`.
+        """
+        if key in self:
+            self._update_meta(key, source)
+            return
+        baseline = seasonal_baseline(df)
+
+        def write(path):
+            write_frame(path / "data", df)
+            np.save(path / "baseline.npy", baseline.stats, allow_pickle=False)
+            if baseline.climatology is not None:
+                np.save(path / "climatology.npy", baseline.climatology, allow_pickle=False)
+            (path / "meta.json").write_text(json.dumps({
+                "name": name,
+                "rows": len(df),
+                "created": datetime.now().isoformat(timespec="seconds"),
+                "sources": [source] if source else [],
+                "cities": [str(city) for city in baseline.cities],
+                "seasons": [str(season) for season in baseline.seasons],
+            }, ensure_ascii=False))
+
+        self._write(key, write)
+        self._update_meta(key, source)
+        self._evict(keep=key)
+
+    @timed("store")
+    def save_analysis(self, key, analysis):
+        """Сохраняет результат `analyze_cities` набора `key` рядом с данными, если его там еще нет."""
+        path = self.root / key / "analysis"
+        if key not in self or path.exists() or not all(isinstance(s, slice) for s in analysis.slices.values()):
+            return
+        tmp_path = self.root / key / f".analysis.{uuid.uuid4().hex}.tmp"
+        try:
+            write_frame(tmp_path, analysis.frame)
+            bounds = {str(city): [s.start, s.stop] for city, s in analysis.slices.items()}
+            (tmp_path / "slices.json").write_text(json.dumps(bounds, ensure_ascii=False))
+            with self._lock:
+                if not path.exists():
+                    os.replace(tmp_path, path)
+        finally:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        self._evict(keep=key)
+
+    @timed("store")
+    def open(self, key):
+        """Открывает набор и кладет его сезонную норму и результат анализа в кэш результатов."""
+        path = self.root / key
+        self._update_meta(key)
+        meta = self.info(key)
+        df = read_frame(path / "data")
+        remember_fingerprint(df, key)
+
+        climatology_path = path / "climatology.npy"
+        baseline = SeasonalBaseline(
+            meta["cities"], meta["seasons"], np.load(path / "baseline.npy"),
+            np.load(climatology_path) if climatology_path.exists() else None,
+        )
+        result_cache.put(("seasonal_baseline", key), baseline)
+
+        if (path / "analysis" / "slices.json").exists():
+            bounds = json.loads((path / "analysis" / "slices.json").read_text())
+            slices = {city: slice(start, stop) for city, (start, stop) in bounds.items()}
+            result_cache.put(("analyze_cities", key), CityAnalysis(read_frame(path / "analysis"), slices))
+        return df
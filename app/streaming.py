@@ -0,0 +1,228 @@
+import os
+import tempfile
+import uuid
+import weakref
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from app.baseline import SeasonalBaseline
+from app.cache import result_cache
+from app.metrics import timed
+from app.ingest import CATEGORICAL_COLUMNS, FLOAT32_COLUMNS, TIMESTAMP_COLUMN
+
+
+__all__ = ['HistogramSketch', 'StreamingAggregates', 'StreamedDataset', 'stream_csv']
+
+
+SPILL_DIR = os.environ.get("DATA_SPILL_DIR") or os.path.join(tempfile.gettempdir(), "weather_spill")
+CHUNK_SIZE = 500_000
+
+
+class HistogramSketch:
+    """Гистограмма с фиксированным шагом для приближенных квантилей, ошибка не больше ширины корзины."""
+
+    def __init__(self, low=-90.0, high=70.0, width=0.1):
+        self.low = low
+        self.width = width
+        self.n_bins = int(round((high - low) / width))
+
+    def bins(self, values):
+        return np.clip(((values - self.low) / self.width).astype(np.int64), 0, self.n_bins - 1)
+
+    def quantile(self, counts, q):
+        total = counts.sum()
+        if total == 0:
+            return np.nan
+        cumulative = np.cumsum(counts)
+        target = q * total
+        index = int(np.searchsorted(cumulative, target, side="left"))
+        before = cumulative[index - 1] if index > 0 else 0
+        fraction = (target - before) / counts[index] if counts[index] else 0.0
+        return self.low + (index + fraction) * self.width
+
+
+def _moments(grouped):
+    stats = grouped.agg(["count", "mean", "var"])
+    stats["m2"] = (stats.pop("var") * (stats["count"] - 1)).fillna(0.0)
+    return stats
+
+
+def _merge_moments(state, chunk):
+    """Объединяет (count, mean, m2) двух частей по формуле Чана."""
+    if state is None:
+        return chunk
+    left, right = state.align(chunk, join="outer", fill_value=0)
+    count = left["count"] + right["count"]
+    delta = right["mean"] - left["mean"]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        share = (right["count"] / count).fillna(0.0)
+        m2 = left["m2"] + right["m2"] + delta ** 2 * left["count"] * share
+    return pd.DataFrame({"count": count, "mean": left["mean"] + delta * share, "m2": m2})
+
+
+class StreamingAggregates:
+    """Инкрементальные агрегаты по городам: моменты, сезонные квантильные скетчи и среднегодовые значения."""
+
+    def __init__(self, sketch=None):
+        self.sketch = sketch or HistogramSketch()
+        self.city_moments = None
+        self.city_min = pd.Series(dtype="float64")
+        self.city_max = pd.Series(dtype="float64")
+        self.season_moments = None
+        self.season_histograms = {}
+        self.yearly = None
+        self.rows = 0
+
+    def update(self, chunk):
+        chunk = chunk.dropna(subset=["city", "temperature"])
+        temperature = chunk["temperature"].astype("float64")
+        self.rows += len(chunk)
+
+        by_city = temperature.groupby(chunk["city"], observed=True)
+        self.city_moments = _merge_moments(self.city_moments, _moments(by_city))
+        self.city_min = self.city_min.combine(by_city.min(), min, fill_value=np.inf)
+        self.city_max = self.city_max.combine(by_city.max(), max, fill_value=-np.inf)
+
+        if "season" in chunk.columns:
+            keys = [chunk["city"], chunk["season"]]
+            self.season_moments = _merge_moments(
+                self.season_moments, _moments(temperature.groupby(keys, observed=True))
+            )
+            codes, uniques = pd.MultiIndex.from_arrays(keys).factorize()
+            flat = codes.astype(np.int64) * self.sketch.n_bins + self.sketch.bins(temperature.to_numpy())
+            cells, counts = np.unique(flat[codes >= 0], return_counts=True)
+            key_codes = cells // self.sketch.n_bins
+            bounds = np.flatnonzero(np.diff(key_codes)) + 1
+            for start, stop in zip(np.r_[0, bounds], np.r_[bounds, len(cells)]):
+                if start == stop:
+                    continue
+                histogram = self.season_histograms.setdefault(
+                    uniques[key_codes[start]], np.zeros(self.sketch.n_bins, dtype=np.int64)
+                )
+                histogram[cells[start:stop] % self.sketch.n_bins] += counts[start:stop]
+
+        if TIMESTAMP_COLUMN in chunk.columns:
+            years = pd.to_datetime(chunk[TIMESTAMP_COLUMN]).dt.year.rename("year")
+            yearly = temperature.groupby([chunk["city"], years], observed=True).agg(["sum", "count"])
+            self.yearly = yearly if self.yearly is None else self.yearly.add(yearly, fill_value=0)
+
+    @property
+    def cities(self):
+        return [] if self.city_moments is None else self.city_moments.index.tolist()
+
+    def city_summary(self):
+        moments = self.city_moments
+        return pd.DataFrame({
+            "count": moments["count"].astype("int64"),
+            "mean": moments["mean"],
+            "std": np.sqrt(moments["m2"] / (moments["count"] - 1)),
+            "min": self.city_min.reindex(moments.index),
+            "max": self.city_max.reindex(moments.index),
+        }).rename_axis("city").reset_index()
+
+    def seasonal_summary(self):
+        moments = self.season_moments
+        quantiles = {
+            name: [self.sketch.quantile(self.season_histograms[key], q) for key in moments.index]
+            for name, q in (("q1", 0.25), ("median", 0.5), ("q3", 0.75))
+        }
+        return pd.DataFrame({
+            "mean": moments["mean"],
+            "std": np.sqrt(moments["m2"] / (moments["count"] - 1)),
+            **quantiles,
+            "count": moments["count"].astype("int64"),
+        }, index=moments.index).rename_axis(["city", "season"]).reset_index()
+
+    def yearly_means(self):
+        return (self.yearly["sum"] / self.yearly["count"]).rename("temperature").reset_index()
+
+
+class StreamedDataset:
+    """Набор данных, сброшенный на диск в Parquet, и его агрегаты.
+
+    Файл на диске удаляется вместе с объектом: когда сессия заменяет или теряет набор и при выходе из процесса.
+    """
+
+    def __init__(self, path, aggregates, preview):
+        self.path = Path(path)
+        self.aggregates = aggregates
+        self.preview = preview
+        self._baseline = None
+        weakref.finalize(self, self.path.unlink, missing_ok=True)
+
+    @property
+    def cities(self):
+        return self.aggregates.cities
+
+    @property
+    def baseline(self):
+        if self._baseline is None:
+            self._baseline = SeasonalBaseline.from_summary(self.aggregates.seasonal_summary())
+        return self._baseline
+
+    def city_frame(self, city):
+        """Читает с диска строки только одного города."""
+        with timed("filter"):
+            df = result_cache.get_or_compute(
+                ("streamed_city", str(self.path), city),
+                lambda: _compact(pd.read_parquet(self.path, filters=[("city", "==", city)])),
+            )
+            return df.copy()
+
+
+def _compact(df):
+    for column in CATEGORICAL_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].astype("category")
+    return df
+
+
+def _spill_schema(chunk):
+    """Схема файла сброса по первой части: строковые и целиком пустые в ней столбцы всегда `string`,
+    иначе первая непустая строка в следующих частях не подошла бы к типу `null` или `double`.
+    """
+    import pyarrow as pa
+
+    schema = pa.Schema.from_pandas(chunk, preserve_index=False)
+    for position, field in enumerate(schema):
+        column = chunk[field.name]
+        if column.dtype == object or (field.name not in FLOAT32_COLUMNS and column.isna().all()):
+            schema = schema.set(position, field.with_type(pa.string()))
+    return schema
+
+
+def _spill_table(chunk, schema):
+    import pyarrow as pa
+
+    for field in schema:
+        if field.type == pa.string() and chunk[field.name].dtype != object:
+            chunk[field.name] = chunk[field.name].astype("string")
+    return pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
+
+
+@timed("ingest")
+def stream_csv(source, chunksize=CHUNK_SIZE, spill_dir=SPILL_DIR, preview_rows=1000):
+    """Читает CSV частями, обновляя агрегаты и сбрасывая строки в Parquet без загрузки файла целиком."""
+    import pyarrow.parquet as pq
+
+    Path(spill_dir).mkdir(parents=True, exist_ok=True)
+    path = Path(spill_dir) / f"{uuid.uuid4().hex}.parquet"
+    aggregates = StreamingAggregates()
+    dtype = {column: "float32" for column in FLOAT32_COLUMNS}
+    writer = None
+    preview = None
+    try:
+        for chunk in pd.read_csv(source, chunksize=chunksize, dtype=dtype):
+            if TIMESTAMP_COLUMN in chunk.columns:
+                chunk[TIMESTAMP_COLUMN] = pd.to_datetime(chunk[TIMESTAMP_COLUMN])
+            aggregates.update(chunk)
+            if preview is None:
+                preview = _compact(chunk.head(preview_rows).copy())
+
+            if writer is None:
+                writer = pq.ParquetWriter(path, _spill_schema(chunk))
+            writer.write_table(_spill_table(chunk, writer.schema))
+    finally:
+        if writer is not None:
+            writer.close()
+    return StreamedDataset(path, aggregates, preview)
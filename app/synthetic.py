@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+
+
+__all__ = ['SEASONAL_TEMPERATURES', 'MONTH_TO_SEASON', 'city_names', 'generate_temperature_data']
+
+
+# Средние температуры городов по сезонам, как в app/notebooks/generated_data.ipynb.
+SEASONAL_TEMPERATURES = {
+    "New York": {"winter": 0, "spring": 10, "summer": 25, "autumn": 15},
+    "London": {"winter": 5, "spring": 11, "summer": 18, "autumn": 12},
+    "Paris": {"winter": 4, "spring": 12, "summer": 20, "autumn": 13},
+    "Tokyo": {"winter": 6, "spring": 15, "summer": 27, "autumn": 18},
+    "Moscow": {"winter": -10, "spring": 5, "summer": 18, "autumn": 8},
+    "Sydney": {"winter": 12, "spring": 18, "summer": 25, "autumn": 20},
+    "Berlin": {"winter": 0, "spring": 10, "summer": 20, "autumn": 11},
+    "Beijing": {"winter": -2, "spring": 13, "summer": 27, "autumn": 16},
+    "Rio de Janeiro": {"winter": 20, "spring": 25, "summer": 30, "autumn": 25},
+    "Dubai": {"winter": 20, "spring": 30, "summer": 40, "autumn": 30},
+    "Los Angeles": {"winter": 15, "spring": 18, "summer": 25, "autumn": 20},
+    "Singapore": {"winter": 27, "spring": 28, "summer": 28, "autumn": 27},
+    "Mumbai": {"winter": 25, "spring": 30, "summer": 35, "autumn": 30},
+    "Cairo": {"winter": 15, "spring": 25, "summer": 35, "autumn": 25},
+    "Mexico City": {"winter": 12, "spring": 18, "summer": 20, "autumn": 15},
+}
+
+MONTH_TO_SEASON = {12: "winter", 1: "winter", 2: "winter",
+                   3: "spring", 4: "spring", 5: "spring",
+                   6: "summer", 7: "summer", 8: "summer",
+                   9: "autumn", 10: "autumn", 11: "autumn"}
+
+SEASONS = ("winter", "spring", "summer", "autumn")
+
+
+def city_names(n_cities):
+    """Первые 15 городов — реальные; следующие получают номер: «Berlin 2», «Berlin 3» и т.д."""
+    base = list(SEASONAL_TEMPERATURES)
+    return [base[i % len(base)] + ("" if i < len(base) else f" {i // len(base) + 1}") for i in range(n_cities)]
+
+
+def generate_temperature_data(n_cities=15, n_years=10, freq="D", seed=0, start="2010-01-01", scale=5.0):
+    """Синтетические наблюдения с той же схемой, что и data/temperature_data.csv.
+
+    Масштабируется числом городов, лет и частотой наблюдений (`freq` в нотации pandas: "D", "h", "15min").
+    Города сверх 15 базовых получают профиль базового города со случайным сдвигом до ±3°C.
+    """
+    rng = np.random.default_rng(seed)
+    timestamps = pd.date_range(start=start, end=pd.Timestamp(start) + pd.DateOffset(years=n_years), freq=freq,
+                               inclusive="left")
+    seasons = pd.Categorical(timestamps.month.map(MONTH_TO_SEASON), categories=SEASONS)
+    names = city_names(n_cities)
+
+    base = np.array([[temperatures[season] for season in SEASONS] for temperatures in SEASONAL_TEMPERATURES.values()])
+    profiles = base[np.arange(n_cities) % len(base)].astype(np.float64)
+    profiles[len(base):] += rng.uniform(-3, 3, size=(max(n_cities - len(base), 0), 1))
+
+    means = profiles[:, seasons.codes].ravel()
+    return pd.DataFrame({
+        "city": np.repeat(names, len(timestamps)),
+        "timestamp": np.tile(timestamps.to_numpy(), n_cities),
+        "temperature": rng.normal(loc=means, scale=scale),
+        "season": np.tile(np.asarray(seasons), n_cities),
+    })
@@ -0,0 +1,120 @@
+import numpy as np
+import pandas as pd
+from app.cache import memoized
+from app.metrics import timed
+
+
+__all__ = ['FREQUENCIES', 'period_grid', 'period_means', 'fit_trends', 'temperature_trends']
+
+
+FREQUENCIES = {"year": "Y", "month": "M"}
+
+
+def _timestamps(df):
+    timestamps = df["timestamp"]
+    if not pd.api.types.is_datetime64_any_dtype(timestamps):
+        timestamps = pd.to_datetime(timestamps)
+    return timestamps.to_numpy(dtype="datetime64[ns]")
+
+
+def period_grid(df, freq="year"):
+    """Средняя температура в сетке (города, периоды) одним bincount; NaN там, где наблюдений нет.
+
+    Возвращает города, начала периодов и сетку средних.
+    """
+    city_codes, cities = pd.factorize(df["city"], sort=True)
+    periods = _timestamps(df).astype(f"datetime64[{FREQUENCIES[freq]}]")
+    period_codes, starts = pd.factorize(periods, sort=True)
+    temperature = df["temperature"].to_numpy(dtype=np.float64, na_value=np.nan)
+
+    valid = (city_codes >= 0) & (period_codes >= 0) & ~np.isnan(temperature)
+    cells = city_codes[valid] * len(starts) + period_codes[valid]
+    size = len(cities) * len(starts)
+    totals = np.bincount(cells, weights=temperature[valid], minlength=size)
+    counts = np.bincount(cells, minlength=size)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = (totals / counts).reshape(len(cities), len(starts))
+    return cities, pd.DatetimeIndex(starts), means
+
+
+@memoized("period_means")
+@timed("groupby")
+def period_means(df, freq="year"):
+    """Среднегодовая (`freq="year"`) или среднемесячная (`"month"`) температура всех городов."""
+    cities, starts, means = period_grid(df, freq)
+    city_index, period_index = np.nonzero(~np.isnan(means))
+    return pd.DataFrame({
+        "city": np.asarray(cities)[city_index],
+        "period": starts[period_index],
+        "temperature": means[city_index, period_index],
+    })
+
+
+def fit_trends(x, y, confidence=0.95):
+    """Прямые y = a + b·x методом наименьших квадратов для всех рядов сразу.
+
+    `y` — матрица (ряды, точки) с NaN на месте пропусков, `x` — общие для всех рядов абсциссы.
+    Нормальные уравнения всех рядов собираются в стопку матриц 2×2 и решаются одним вызовом `np.linalg.solve`.
+    Возвращает свободный член, наклон, его стандартную ошибку, границы доверительного интервала
+    (по распределению Стьюдента с n − 2 степенями свободы) и число точек; для рядов меньше чем из трех точек — NaN.
+    """
+    from scipy.special import stdtrit
+
+    y = np.asarray(y, dtype=np.float64)
+    x = np.asarray(x, dtype=np.float64)
+    weights = (~np.isnan(y)).astype(np.float64)
+    filled = np.where(weights > 0, y, 0.0)
+    design = np.stack([np.ones_like(x), x], axis=1)
+
+    gram = np.einsum("gp,pi,pj->gij", weights, design, design)
+    moments = np.einsum("gp,pi->gi", weights * filled, design)
+    n = weights.sum(axis=1)
+    fitted = n >= 3
+
+    coefficients = np.full((len(y), 2), np.nan)
+    stderr = np.full(len(y), np.nan)
+    if fitted.any():
+        coefficients[fitted] = np.linalg.solve(gram[fitted], moments[fitted][..., None])[..., 0]
+        residuals = weights[fitted] * (filled[fitted] - coefficients[fitted] @ design.T)
+        variance = (residuals ** 2).sum(axis=1) / (n[fitted] - 2)
+        stderr[fitted] = np.sqrt(variance * np.linalg.inv(gram[fitted])[:, 1, 1])
+
+    with np.errstate(invalid="ignore"):
+        margin = stdtrit(np.maximum(n - 2, 1), 0.5 + confidence / 2) * stderr
+    slope = coefficients[:, 1]
+    return coefficients[:, 0], slope, stderr, slope - margin, slope + margin, n.astype(np.int64)
+
+
+@memoized("temperature_trends")
+@timed("trends")
+def temperature_trends(df, freq="year", confidence=0.95):
+    """Линейные тренды температуры всех городов в °C за десятилетие с доверительными интервалами.
+
+    Для месячного шага из средних вычитается климатическая норма каждого календарного месяца города,
+    чтобы сезонный ход и неполные годы не искажали наклон.
+    """
+    cities, starts, means = period_grid(df, freq)
+    years = starts.year + (starts.month - 1) / 12 if freq == "month" else starts.year
+    x = np.asarray(years, dtype=np.float64)
+    if freq == "month":
+        months = np.asarray(starts.month) - 1
+        with np.errstate(invalid="ignore"):
+            for month in range(12):
+                columns = months == month
+                if columns.any():
+                    means[:, columns] -= np.nanmean(means[:, columns], axis=1, keepdims=True)
+
+    _, slope, stderr, low, high, n = fit_trends(x - x.mean() if len(x) else x, means, confidence)
+    observed = ~np.isnan(means)
+    first = np.where(observed.any(axis=1), observed.argmax(axis=1), 0)
+    last = np.where(observed.any(axis=1), len(starts) - 1 - observed[:, ::-1].argmax(axis=1), 0)
+    return pd.DataFrame({
+        "city": np.asarray(cities),
+        "periods": n,
+        "start": starts[first] if len(starts) else pd.NaT,
+        "end": starts[last] if len(starts) else pd.NaT,
+        "slope": slope * 10,
+        "ci_low": low * 10,
+        "ci_high": high * 10,
+        "stderr": stderr * 10,
+    })
@@ -0,0 +1,158 @@
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from app.ingest import read_temperature_csv, read_temperature_parquet
+from app.pages.data_analysis import analyze_data_parallel, analyze_data_sequential
+from app.settings.api_client import OpenWeatherMapClient
+from app.settings.stub_server import FakeOpenWeatherMapServer
+from app.statistics import seasonal_statistics
+from app.synthetic import generate_temperature_data
+
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = ROOT / "benchmarks" / "results"
+
+
+def time_call(func, repeat):
+    durations = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start_time)
+    return durations
+
+
+def analysis_benchmarks(df):
+    csv_bytes = df.to_csv(index=False).encode()
+    parquet_buffer = io.BytesIO()
+    df.to_parquet(parquet_buffer, index=False)
+    parquet_bytes = parquet_buffer.getvalue()
+    compact = read_temperature_csv(io.BytesIO(csv_bytes))
+    return {
+        "parse_csv": lambda: read_temperature_csv(io.BytesIO(csv_bytes)),
+        "parse_parquet": lambda: read_temperature_parquet(io.BytesIO(parquet_bytes)),
+        "analyze_sequential": lambda: analyze_data_sequential(compact),
+        "analyze_parallel": lambda: analyze_data_parallel(compact, min_rows=0),
+        "seasonal_statistics": lambda: seasonal_statistics.uncached(compact),
+    }
+
+
+def startup_benchmarks():
+    """Холодный импорт приложения в отдельном процессе — то, что платит каждый запуск контейнера."""
+    command = [sys.executable, "-c", "import main"]
+    return {"import_main": lambda: subprocess.run(command, cwd=ROOT, check=True, capture_output=True)}
+
+
+def api_benchmarks(client, cities):
+    return {
+        "fetch_sync": lambda: [client.get_current_temperature(city) for city in cities],
+        "fetch_async": lambda: client.get_current_temperatures(cities),
+    }
+
+
+def run_benchmarks(n_cities=15, n_years=10, freq="D", repeat=5, latency=0.05, api=True, report=print):
+    """Замеряет основные пути приложения на синтетических данных; возвращает словарь для сохранения в JSON."""
+    df = generate_temperature_data(n_cities, n_years, freq)
+    results = {}
+
+    def measure(name, func, rows):
+        func()
+        durations = time_call(func, repeat)
+        median = statistics.median(durations)
+        results[name] = {
+            "median": median,
+            "min": min(durations),
+            "max": max(durations),
+            "rows_per_s": rows / median if median > 0 else None,
+        }
+        report(f"{name:<22} {median * 1000:10.2f} мс  (min {min(durations) * 1000:.2f} мс)")
+
+    for name, func in analysis_benchmarks(df).items():
+        measure(name, func, len(df))
+    for name, func in startup_benchmarks().items():
+        measure(name, func, 1)
+
+    if api:
+        cities = sorted(df["city"].unique())
+        with FakeOpenWeatherMapServer(latency=latency) as server:
+            client = OpenWeatherMapClient(api_key="benchmark", base_url=server.base_url, cache_ttl=0)
+            try:
+                for name, func in api_benchmarks(client, cities).items():
+                    measure(name, func, len(cities))
+            finally:
+                client.close()
+
+    return {
+        "meta": {
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "cities": n_cities,
+            "years": n_years,
+            "freq": freq,
+            "rows": len(df),
+            "repeat": repeat,
+            "latency": latency,
+            "cpu_count": os.cpu_count(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+
+
+def compare(current, baseline, threshold=0.1):
+    """Сравнивает медианы с сохраненным прогоном: список (тест, было, стало, изменение) для замедлений."""
+    regressions = []
+    for name, result in current["results"].items():
+        previous = baseline["results"].get(name)
+        if previous is None or not previous["median"]:
+            continue
+        change = result["median"] / previous["median"] - 1
+        if change > threshold:
+            regressions.append((name, previous["median"], result["median"], change))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарки анализа, загрузки и запросов к API")
+    parser.add_argument("--cities", type=int, default=15)
+    parser.add_argument("--years", type=int, default=10)
+    parser.add_argument("--freq", default="D", help="частота наблюдений в нотации pandas: D, h, 15min")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.05, help="задержка ответа заглушки API, секунды")
+    parser.add_argument("--no-api", action="store_true", help="не замерять запросы к API")
+    parser.add_argument("--output", help="JSON-файл с результатами (по умолчанию benchmarks/results/...)")
+    parser.add_argument("--baseline", help="JSON-файл прошлого прогона для сравнения")
+    parser.add_argument("--threshold", type=float, default=0.1, help="допустимое замедление, доля")
+    args = parser.parse_args(argv)
+
+    result = run_benchmarks(args.cities, args.years, args.freq, args.repeat, args.latency, api=not args.no_api)
+
+    output = Path(args.output) if args.output else RESULTS_DIR / (
+        f"{datetime.now():%Y%m%d-%H%M%S}-{args.cities}x{args.years}-{args.freq}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(result, indent=2, ensure_ascii=False))
+    print(f"Результаты сохранены: {output}")
+
+    if args.baseline:
+        regressions = compare(result, json.loads(Path(args.baseline).read_text()), args.threshold)
+        for name, before, after, change in regressions:
+            print(f"Замедление {name}: {before * 1000:.2f} мс → {after * 1000:.2f} мс (+{change:.0%})")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import argparse
+import time
+from functools import partial
+from pathlib import Path
+from app.analysis import analyze_cities
+from app.ingest import load_dataset
+from app.parallel import PARALLEL_MIN_ROWS, shared_memory_kernel
+from app.statistics import seasonal_statistics, yearly_means
+from app.trends import temperature_trends
+
+
+def run_batch(source, output_dir, window=30, std_dev_factor=2, min_parallel_rows=PARALLEL_MIN_ROWS,
+              full=False, report=print):
+    """Анализирует набор данных без интерфейса и сохраняет результаты в Parquet.
+
+    Возвращает словарь этап → (секунды, строк в секунду).
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    timings = {}
+
+    def record(name, elapsed):
+        timings[name] = (elapsed, len(df) / elapsed if elapsed > 0 else float("inf"))
+        report(f"{name}: {elapsed:.2f} с, {timings[name][1]:,.0f} строк/с")
+
+    def stage(name, func):
+        start_time = time.perf_counter()
+        result = func()
+        record(name, time.perf_counter() - start_time)
+        return result
+
+    start_time = time.perf_counter()
+    df = load_dataset(source)
+    record("Чтение", time.perf_counter() - start_time)
+
+    kernel = partial(shared_memory_kernel, min_rows=min_parallel_rows)
+    analysis = stage("Скользящее среднее и аномалии",
+                     lambda: analyze_cities(df, window, std_dev_factor, kernel=kernel))
+    seasonal = stage("Сезонная статистика", lambda: seasonal_statistics.uncached(df))
+    yearly = stage("Среднегодовые тренды", lambda: yearly_means.uncached(df))
+    trends = stage("Тренды потепления", lambda: temperature_trends.uncached(df))
+
+    def write():
+        frame = analysis.frame
+        frame[frame["is_anomaly"]].to_parquet(output_dir / "anomalies.parquet", index=False)
+        seasonal.to_parquet(output_dir / "seasonal_profiles.parquet", index=False)
+        yearly.to_parquet(output_dir / "yearly_trends.parquet", index=False)
+        trends.sort_values("slope", ascending=False).to_parquet(output_dir / "warming_trends.parquet", index=False)
+        if full:
+            frame.to_parquet(output_dir / "analysis.parquet", index=False)
+
+    stage("Запись", write)
+    total = sum(elapsed for elapsed, _ in timings.values())
+    report(f"Всего: {len(df)} строк за {total:.2f} с, {len(df) / total:,.0f} строк/с → {output_dir}")
+    return timings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Пакетный анализ температурных данных без Streamlit")
+    parser.add_argument("source", help="CSV или Parquet с колонками city, timestamp, temperature, season")
+    parser.add_argument("-o", "--output-dir", default="results", help="каталог для Parquet-файлов с результатами")
+    parser.add_argument("--window", type=int, default=30, help="окно скользящего среднего, дни")
+    parser.add_argument("--std-dev-factor", type=float, default=2, help="порог аномалии в σ")
+    parser.add_argument("--min-parallel-rows", type=int, default=PARALLEL_MIN_ROWS,
+                        help="с какого числа строк анализ выполняется на всех ядрах")
+    parser.add_argument("--full", action="store_true", help="сохранить также все строки со скользящим средним")
+    args = parser.parse_args(argv)
+
+    run_batch(args.source, args.output_dir, args.window, args.std_dev_factor, args.min_parallel_rows, args.full)
+
+
+if __name__ == "__main__":
+    main()
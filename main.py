@@ -1,33 +1,45 @@
 import sys
+import time
 from pathlib import Path
+
+_started = time.perf_counter()
+
 import streamlit as st
-from app.logging_config import LoggedSession
-from app.pages.data_upload import upload_dataset
-from app.pages.data_analysis import analyze_data
-from app.pages.current_temperature import monitor_temperature
-from app.pages.visualization import visualize_data
+from app.lazy import load, record_import
+from app.logging_config import configure_logging
+from app.metrics import metrics
+from app.registry import UserSession
+from app.pages.diagnostics import display_diagnostics
 
 
 sys.path.append(str(Path(__file__).resolve().parent))
-session = LoggedSession()
+configure_logging()
+record_import("main", time.perf_counter() - _started)
 
+# Страницы импортируются при первом открытии вкладки: plotly и aiohttp не замедляют холодный старт.
+PAGES = {
+    "📁 Загрузка данных": "app.pages.data_upload:upload_dataset",
+    "📊 Анализ данных": "app.pages.data_analysis:analyze_data",
+    "📈 Визуализация": "app.pages.visualization:visualize_data",
+    "🌡️ Текущая температура OpenWeatherAPI": "app.pages.current_temperature:monitor_temperature",
+}
 
-def main():
-    st.title("🌍 Анализ температурных данных")
 
-    tab1, tab2, tab3, tab4 = st.tabs(
-        ["📁 Загрузка данных", "📊 Анализ данных", "📈 Визуализация", "🌡️ Текущая температура OpenWeatherAPI"]
-    )
+def user_session():
+    """Состояние текущего пользователя: своя сессия на каждую вкладку браузера, наборы данных — в общем реестре."""
+    if "user_session" not in st.session_state:
+        st.session_state["user_session"] = UserSession()
+    return st.session_state["user_session"]
+
 
-    with tab1:
-        upload_dataset(session)
-    with tab2:
-        analyze_data(session)
-    with tab3:
-        visualize_data(session)
-    with tab4:
-        monitor_temperature(session)
+def main():
+    metrics.start_run()
+    session = user_session()
+    st.title("🌍 Анализ температурных данных")
 
+    page = st.radio("Раздел", list(PAGES), horizontal=True, label_visibility="collapsed", key="page")
+    load(PAGES[page])(session)
+    display_diagnostics()
 
     st.markdown(
         """
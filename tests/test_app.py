@@ -1,15 +1,48 @@
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
 import pytest
+import numpy as np
 import pandas as pd
-from app.logging_config import LoggedSession
+from app.analysis import analyze_cities, calculate_rolling_quantiles, group_bounds, rolling_quantile
+from app.anomalies import flag_anomalies
+from app.baseline import SeasonalBaseline
+from app.downsampling import downsample
+from app.cache import ResultCache, TTLCache, fingerprint, memoized, result_cache
+from app.incremental import IncrementalAnalysis
+from app.ingest import append_rows, load_dataset, optimize_dtypes, read_temperature_csv, to_parquet_bytes
+from app.metrics import Metrics
+from app.registry import DatasetRegistry, UserSession
+from app.store import DatasetStore, _disk_bytes, read_frame, write_frame
+from app.preview import append_summaries, city_counts, column_summary, page_count, preview_page
+from app.statistics import moment_statistics, seasonal_statistics
+from app.streaming import stream_csv
+from app.settings.api_client import OpenWeatherMapClient
+from app.settings.stub_server import FakeOpenWeatherMapServer, fake_temperature
+from app.logging_config import LoggedSession, SamplingFilter
 from app.pages.data_upload import upload_dataset
 from app.pages.data_analysis import analyze_data
 from app.pages.visualization import visualize_data
 from app.pages.current_temperature import monitor_temperature
+from app.synthetic import generate_temperature_data
+from app.trends import period_means, temperature_trends
+from benchmarks.run import compare
+from cli import run_batch
 from app.pages.data_analysis import (
     display_descriptive_statistics,
     display_temperature_time_series,
     display_correlation_analysis,
-    display_seasonal_profiles
+    display_seasonal_profiles,
+    analyze_city,
+    analyze_data_sequential,
+    analyze_data_parallel,
+    moving_average_figure,
+    city_statistics,
+    time_series_figure,
 )
 
 
@@ -104,4 +137,674 @@ def test_display_correlation_analysis(session):
 def test_display_seasonal_profiles(session):
     city_data = session.df[session.df["city"] == "Berlin"]
     display_seasonal_profiles(city_data, "Berlin")
-    assert True
\ No newline at end of file
+    assert True
+
+def test_analyze_data_sequential_matches_per_city_analysis(sample_data):
+    results = analyze_data_sequential(sample_data)
+
+    assert results.cities == ["Berlin", "Cairo"]
+    for city in results.cities:
+        expected = analyze_city(sample_data[sample_data["city"] == city])
+        pd.testing.assert_frame_equal(results.city(city), expected, check_dtype=False)
+
+
+def test_analyze_data_parallel_matches_sequential(sample_data):
+    sequential = analyze_data_sequential(sample_data)
+    parallel = analyze_data_parallel(sample_data, min_rows=0)
+    pd.testing.assert_frame_equal(parallel.frame, sequential.frame)
+
+
+def test_result_cache_evicts_least_recently_used():
+    cache = ResultCache(max_bytes=3 * np.zeros(100).nbytes)
+    for key in ("a", "b", "c"):
+        cache.put(key, np.zeros(100))
+    cache.get("a")
+    cache.put("d", np.zeros(100))
+
+    assert "a" in cache and "d" in cache
+    assert "b" not in cache
+    assert cache.size <= cache.max_bytes
+
+
+def test_memoized_reuses_result_for_same_content(sample_data):
+    calls = []
+
+    @memoized("test_memoized", cache=ResultCache(max_bytes=2 ** 20))
+    def count_rows(df):
+        calls.append(1)
+        return len(df)
+
+    assert count_rows(sample_data) == 4
+    assert count_rows(sample_data.copy()) == 4
+    assert len(calls) == 1
+    assert fingerprint(sample_data) != fingerprint(sample_data.head(2))
+
+
+def test_read_temperature_csv_uses_compact_dtypes(tmp_path, sample_data):
+    file_path = tmp_path / "test.csv"
+    sample_data.to_csv(file_path, index=False)
+
+    df = read_temperature_csv(file_path)
+
+    assert isinstance(df["city"].dtype, pd.CategoricalDtype)
+    assert isinstance(df["season"].dtype, pd.CategoricalDtype)
+    assert df["temperature"].dtype == np.float32
+    assert pd.api.types.is_datetime64_any_dtype(df["timestamp"])
+    assert df["city"].tolist() == sample_data["city"].tolist()
+
+
+@pytest.mark.parametrize("engine", ["pyarrow", "c"])
+def test_read_temperature_csv_keeps_missing_timestamp_as_nat(tmp_path, engine):
+    file_path = tmp_path / "test.csv"
+    file_path.write_text("city,timestamp,temperature,season\n"
+                         "Berlin,2023-01-01,10,winter\nBerlin,,12,winter\nCairo,2023-01-02,25,winter\n")
+
+    df = read_temperature_csv(file_path, engine=engine)
+
+    assert df["timestamp"].dtype == "datetime64[ns]"
+    assert df["timestamp"].isna().tolist() == [False, True, False]
+    assert df["temperature"].tolist() == [10, 12, 25]
+
+
+def test_load_dataset_round_trips_parquet(tmp_path, sample_data):
+    file_path = tmp_path / "test.parquet"
+    file_path.write_bytes(to_parquet_bytes(optimize_dtypes(sample_data)))
+
+    df = load_dataset(file_path)
+
+    pd.testing.assert_frame_equal(df, optimize_dtypes(sample_data))
+
+
+def test_stream_csv_matches_in_memory_statistics(tmp_path):
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        "city": np.repeat(["Berlin", "Cairo", "Moscow"], 200),
+        "timestamp": np.tile(pd.date_range("2019-06-01", periods=200, freq="D").astype(str), 3),
+        "temperature": rng.normal(15, 5, 600).round(2),
+        "season": "summer",
+    })
+    file_path = tmp_path / "test.csv"
+    df.to_csv(file_path, index=False)
+
+    stream = stream_csv(file_path, chunksize=70, spill_dir=tmp_path)
+
+    summary = stream.aggregates.city_summary().set_index("city")
+    expected = df.groupby("city")["temperature"].agg(["count", "mean", "std", "min", "max"])
+    pd.testing.assert_frame_equal(summary[expected.columns], expected, check_dtype=False, atol=1e-4)
+
+    seasonal = stream.aggregates.seasonal_summary().set_index(["city", "season"])
+    expected_median = df.groupby(["city", "season"])["temperature"].median()
+    assert np.allclose(seasonal["median"], expected_median, atol=stream.aggregates.sketch.width)
+
+    assert len(stream.city_frame("Cairo")) == 200
+
+
+def test_stream_csv_keeps_string_columns_that_start_empty(tmp_path):
+    file_path = tmp_path / "test.csv"
+    pd.DataFrame({
+        "city": ["Berlin"] * 4 + ["Cairo"] * 4,
+        "temperature": np.arange(8, dtype=float),
+        "station": [None] * 4 + ["C1"] * 4,
+    }).to_csv(file_path, index=False)
+    stream = stream_csv(file_path, chunksize=4, spill_dir=tmp_path)
+    assert stream.city_frame("Cairo")["station"].tolist() == ["C1"] * 4
+    assert stream.city_frame("Berlin")["station"].isna().all()
+
+
+def test_streamed_dataset_removes_spill_file_when_released(tmp_path):
+    file_path = tmp_path / "test.csv"
+    pd.DataFrame({"city": ["Berlin", "Cairo"], "temperature": [1.0, 2.0]}).to_csv(file_path, index=False)
+    stream = stream_csv(file_path, spill_dir=tmp_path / "spill")
+    path = stream.path
+    assert path.exists()
+    del stream
+    assert not path.exists()
+
+
+@pytest.fixture
+def weather_server():
+    with FakeOpenWeatherMapServer(api_key="test", failures={"Cairo": 1}, unknown_cities=["Atlantis"]) as server:
+        yield server
+
+
+def test_get_current_temperatures_fetches_all_cities_concurrently(weather_server):
+    client = OpenWeatherMapClient(api_key="test", base_url=weather_server.base_url, max_concurrency=2, backoff=0.01)
+    try:
+        temperatures = client.get_current_temperatures(["Berlin", "Cairo", "Atlantis"])
+    finally:
+        client.close()
+
+    assert temperatures == {"Berlin": fake_temperature("Berlin"), "Cairo": fake_temperature("Cairo"), "Atlantis": None}
+
+
+def test_ttl_cache_expires_and_persists(tmp_path):
+    now = [1000.0]
+    path = tmp_path / "owm.json"
+    cache = TTLCache(ttl=600, path=path, clock=lambda: now[0])
+    cache.set("berlin|metric", 6.5)
+
+    assert cache.get("berlin|metric") == 6.5
+    assert TTLCache(ttl=600, path=path, clock=lambda: now[0]).get("berlin|metric") == 6.5
+
+    now[0] += 601
+    assert cache.get("berlin|metric") is None
+
+
+def test_repeated_lookups_are_served_from_cache(weather_server):
+    client = OpenWeatherMapClient(api_key="test", base_url=weather_server.base_url, backoff=0.01)
+    try:
+        first = client.get_current_temperatures(["Berlin", "Paris"])
+        second = client.get_current_temperatures(["Berlin", "Paris"])
+    finally:
+        client.close()
+
+    assert first == second
+    assert client.cache.hits == 2
+
+
+def test_batch_fetch_persists_cache_once(weather_server, tmp_path, monkeypatch):
+    path = tmp_path / "owm.json"
+    client = OpenWeatherMapClient(api_key="test", base_url=weather_server.base_url, backoff=0.01, cache_path=path)
+    writes = []
+    persist = client.cache._persist
+    monkeypatch.setattr(client.cache, "_persist", lambda: writes.append(1) or persist())
+    try:
+        temperatures = client.get_current_temperatures(["Berlin", "Paris", "Cairo", "London"])
+    finally:
+        client.close()
+
+    assert len(writes) == 1
+    assert TTLCache(ttl=600, path=path).get("berlin|metric") == temperatures["Berlin"]
+
+
+def test_sync_client_uses_pooled_session_against_stub(weather_server):
+    client = OpenWeatherMapClient(base_url=weather_server.base_url, backoff=0.01)
+    try:
+        assert client.check_api_key("test")
+        assert not client.check_api_key("wrong")
+        assert client.get_current_temperature("Cairo", "test") == fake_temperature("Cairo")
+        assert client.get_current_temperature("Atlantis", "test") is None
+        requests_before = weather_server.requests
+        assert client.get_current_temperature("London", "test") == fake_temperature("London")
+        assert weather_server.requests == requests_before
+    finally:
+        client.close()
+
+
+def test_seasonal_baseline_skips_missing_timestamps(sample_data):
+    data = sample_data.assign(timestamp=pd.to_datetime(sample_data["timestamp"]))
+    data.loc[1, "timestamp"] = pd.NaT
+
+    baseline = SeasonalBaseline.from_frame(data)
+
+    assert baseline.lookup("Berlin", "Winter")["mean"] == pytest.approx(11.0)
+    assert baseline.day_normal("Berlin", pd.Timestamp("2023-01-01")) == pytest.approx(10.0)
+    assert baseline.day_normal("Berlin", pd.Timestamp("2023-01-02")) is None
+
+
+def test_day_of_year_climatology_aligns_calendar_dates_across_leap_years():
+    data = pd.DataFrame({
+        "city": "Berlin",
+        "timestamp": pd.to_datetime(["2020-03-01", "2021-03-01", "2020-02-29", "2021-02-28"]),
+        "temperature": [4.0, 6.0, 1.0, 3.0],
+        "season": "winter",
+    })
+    baseline = SeasonalBaseline.from_frame(data)
+
+    assert baseline.day_normal("Berlin", pd.Timestamp("2022-03-01")) == pytest.approx(5.0)
+    assert baseline.day_normal("Berlin", pd.Timestamp("2024-02-29")) == pytest.approx(1.0)
+    assert baseline.day_normal("Berlin", pd.Timestamp("2024-02-28")) == pytest.approx(3.0)
+
+
+def test_seasonal_baseline_matches_groupby_statistics(sample_data):
+    baseline = SeasonalBaseline.from_frame(sample_data)
+
+    stats = baseline.lookup("Berlin", "Winter")
+    assert stats["mean"] == pytest.approx(11.0)
+    assert stats["q1"] == pytest.approx(10.5)
+    assert stats["q3"] == pytest.approx(11.5)
+    assert baseline.lookup("Berlin", "Summer") is None
+    assert baseline.is_normal("Cairo", "Summer", 25.5)
+    assert not baseline.is_normal("Cairo", "Summer", 30)
+    assert baseline.day_normal("Cairo", pd.Timestamp("2024-01-02")) == pytest.approx(26.0)
+
+
+def test_seasonal_statistics_matches_pandas_quantiles(sample_data):
+    data = pd.concat([sample_data, sample_data.assign(temperature=[3, 20, 31, np.nan])], ignore_index=True)
+
+    result = seasonal_statistics(data)
+
+    expected = data.groupby(["city", "season"])["temperature"].agg(
+        mean="mean",
+        std="std",
+        median="median",
+        q1=lambda x: x.quantile(0.25),
+        q3=lambda x: x.quantile(0.75),
+        count="size",
+    ).reset_index()
+    pd.testing.assert_frame_equal(result, expected)
+
+
+def test_downsample_keeps_extremes_and_marked_rows():
+    rng = np.random.default_rng(0)
+    data = pd.DataFrame({
+        "timestamp": pd.date_range("2010-01-01", periods=20_000, freq="D"),
+        "temperature": rng.normal(10, 5, 20_000),
+    })
+    keep = np.zeros(len(data), dtype=bool)
+    keep[[123, 4567]] = True
+
+    for method in ("lttb", "minmax"):
+        result = downsample(data, "timestamp", "temperature", n_points=500, method=method, keep=keep)
+
+        assert len(result) <= 500 + 4
+        assert {123, 4567, data["temperature"].idxmin(), data["temperature"].idxmax()} <= set(result.index)
+        assert result["timestamp"].is_monotonic_increasing
+
+
+def test_pages_without_dataset_do_not_fail():
+    session = LoggedSession()
+
+    analyze_data(session)
+    visualize_data(session)
+
+    assert not hasattr(session, "streamed")
+
+
+def test_figures_are_cached_per_dataset_and_city(sample_data):
+    berlin = sample_data[sample_data["city"] == "Berlin"]
+
+    figure = time_series_figure(berlin, "Berlin")
+
+    assert time_series_figure(berlin.copy(), "Berlin") is figure
+    assert time_series_figure(sample_data[sample_data["city"] == "Cairo"], "Cairo") is not figure
+
+
+def test_preview_pages_and_summary(sample_data):
+    df = optimize_dtypes(sample_data.assign(temperature=[10, None, 25, 26]))
+
+    page = preview_page(df, 2, 3)
+    assert len(page) == 1
+    assert page["temperature"].tolist() == [26.0]
+    assert len(preview_page(df, 10, 3)) == 1
+    assert page_count(len(df), 3) == 2
+
+    summary = column_summary(df).set_index("column")
+    assert summary.loc["temperature", "nulls"] == 1
+    assert summary.loc["city", "dtype"] == "category"
+    assert city_counts(df).set_index("city")["rows"].to_dict() == {"Berlin": 2, "Cairo": 2}
+
+
+def test_incremental_append_matches_full_recompute():
+    rng = np.random.default_rng(1)
+    data = optimize_dtypes(pd.DataFrame({
+        "city": np.repeat(["Berlin", "Cairo"], 100),
+        "timestamp": np.tile(pd.date_range("2023-01-01", periods=100).astype(str), 2),
+        "temperature": rng.normal(15, 8, 200),
+        "season": "winter",
+    }))
+    history = data.groupby("city", observed=True).head(80).reset_index(drop=True)
+    new_rows = data.groupby("city", observed=True).tail(20).reset_index(drop=True)
+    new_rows.loc[0, "temperature"] = 90.0
+    new_rows.loc[len(new_rows)] = ["Tokyo", pd.Timestamp("2023-04-11"), 12.0, "spring"]
+
+    incremental = IncrementalAnalysis.from_frame(history, window=7)
+    appended = incremental.append(new_rows)
+    expected = analyze_cities(pd.concat([history, new_rows], ignore_index=True), window=7)
+
+    for city in ["Berlin", "Cairo", "Tokyo"]:
+        result, reference = incremental.analysis.city(city), expected.city(city)
+        np.testing.assert_allclose(result["moving_avg"], reference["moving_avg"])
+        np.testing.assert_array_equal(result["is_anomaly"].tail(20), reference["is_anomaly"].tail(20))
+    assert appended["is_anomaly"].iloc[0]
+    assert incremental.aggregates.city_summary().set_index("city").loc["Tokyo", "count"] == 1
+
+    full = pd.concat([history, new_rows], ignore_index=True)
+    baseline, reference = incremental.baseline, SeasonalBaseline.from_frame(full)
+    assert baseline.lookup("Cairo", "winter")["mean"] == pytest.approx(reference.lookup("Cairo", "winter")["mean"])
+    for city, day in [("Berlin", pd.Timestamp("2023-04-05")), ("Tokyo", pd.Timestamp("2023-04-11"))]:
+        assert baseline.day_normal(city, day) == pytest.approx(reference.day_normal(city, day))
+
+    combined = append_rows(history, new_rows)
+    append_summaries(history, new_rows, combined)
+    counts = result_cache.get(("city_counts", fingerprint(combined)))
+    assert counts.set_index("city")["rows"].to_dict() == {"Berlin": 100, "Cairo": 100, "Tokyo": 1}
+    summary = result_cache.get(("column_summary", fingerprint(combined)))
+    expected = column_summary.uncached(combined)
+    pd.testing.assert_frame_equal(summary.drop(columns="memory_mb"), expected.drop(columns="memory_mb"))
+
+
+def test_append_rows_fills_optional_columns_and_requires_core_ones(sample_data):
+    df = optimize_dtypes(sample_data)
+    new_rows = pd.DataFrame({"city": ["Berlin"], "timestamp": ["2023-01-03"], "temperature": [9.0], "season": ["Winter"]})
+
+    appended = append_rows(df, new_rows)
+    assert len(appended) == 5 and appended["humidity"].isna().tolist() == [False] * 4 + [True]
+    assert appended["humidity"].iloc[0] == 60
+    with pytest.raises(ValueError, match="temperature"):
+        append_rows(df, new_rows.drop(columns="temperature"))
+
+
+def test_batch_cli_writes_parquet_results(tmp_path, sample_data):
+    source = tmp_path / "data.csv"
+    sample_data.to_csv(source, index=False)
+    messages = []
+
+    timings = run_batch(source, tmp_path / "out", window=2, min_parallel_rows=0, full=True, report=messages.append)
+
+    assert set(timings) >= {"Чтение", "Сезонная статистика", "Запись"}
+    assert "строк/с" in messages[-1]
+    yearly = pd.read_parquet(tmp_path / "out" / "yearly_trends.parquet")
+    assert yearly.set_index("city")["temperature"].to_dict() == {"Berlin": 11.0, "Cairo": 25.5}
+    assert len(pd.read_parquet(tmp_path / "out" / "analysis.parquet")) == len(sample_data)
+    assert (tmp_path / "out" / "seasonal_profiles.parquet").exists()
+    assert pd.read_parquet(tmp_path / "out" / "warming_trends.parquet")["slope"].isna().all()
+
+
+def test_synthetic_generator_scales_and_matches_schema():
+    data = generate_temperature_data(n_cities=17, n_years=1, freq="12h", seed=3)
+
+    assert list(data.columns) == ["city", "timestamp", "temperature", "season"]
+    assert len(data) == 17 * 730
+    assert data["city"].nunique() == 17 and "Berlin 2" not in set(data["city"]) and "New York 2" in set(data["city"])
+    winter = data[data["city"] == "Moscow"].groupby("season")["temperature"].mean()
+    assert winter["winter"] == pytest.approx(-10, abs=1.5)
+
+
+def test_benchmark_comparison_flags_regressions():
+    baseline = {"results": {"analyze_sequential": {"median": 1.0}, "parse_csv": {"median": 2.0}}}
+    current = {"results": {"analyze_sequential": {"median": 1.5}, "parse_csv": {"median": 2.1}, "new": {"median": 1}}}
+
+    assert compare(current, baseline, threshold=0.1) == [("analyze_sequential", 1.0, 1.5, pytest.approx(0.5))]
+
+
+def test_metrics_collect_stage_timings_and_gauges():
+    registry = Metrics()
+    registry.gauge("cache_hits", lambda: 3)
+
+    @registry.timed("groupby")
+    def work():
+        return 42
+
+    registry.start_run()
+    assert work() == 42
+    with registry.timed("figure"):
+        pass
+    with registry.timed("figure"):
+        pass
+
+    run = registry.run_timings().set_index("stage")["count"].to_dict()
+    assert run == {"groupby": 1, "figure": 2}
+    assert registry.timings().set_index("stage").loc["figure", "count"] == 2
+    exported = registry.to_prometheus(prefix="test")
+    assert 'test_stage_seconds_count{stage="figure"} 2' in exported
+    assert "test_cache_hits 3" in exported
+
+
+def test_timed_decorator_measures_overlapping_calls_independently():
+    registry = Metrics()
+
+    @registry.timed("http")
+    def wait(seconds):
+        time.sleep(seconds)
+
+    threads = [threading.Thread(target=wait, args=(seconds,)) for seconds in (0.3, 0.2)]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.05)
+    for thread in threads:
+        thread.join()
+
+    assert registry.timings().set_index("stage").loc["http", "total_ms"] >= 480
+
+
+def test_logged_session_samples_requests_and_formats_lazily(weather_server, caplog):
+    sampling = SamplingFilter(every=2)
+    logger = logging.getLogger("app.http")
+    logger.addFilter(sampling)
+    try:
+        with caplog.at_level(logging.INFO, logger="app.http"):
+            session = LoggedSession()
+            for _ in range(4):
+                session.get(weather_server.base_url, params={"q": "Berlin", "appid": "test", "units": "metric"})
+    finally:
+        logger.removeFilter(sampling)
+
+    request_ids = {record.request_id for record in caplog.records}
+    assert len(request_ids) == 2
+    assert all(record.args for record in caplog.records)
+    assert not any(record.levelno == logging.DEBUG for record in caplog.records)
+
+
+def test_anomaly_methods_match_pandas_definitions():
+    data = generate_temperature_data(n_cities=3, n_years=2, seed=5)
+    data.loc[[10, 900], "temperature"] = [60.0, -40.0]
+    by_city = data.groupby("city")["temperature"]
+
+    rolling_mean = by_city.transform(lambda x: x.rolling(30, min_periods=1).mean())
+    rolling_std = by_city.transform(lambda x: x.rolling(30, min_periods=2).std())
+    expected = {
+        "rolling": (data["temperature"] - rolling_mean).abs() > 2 * rolling_std,
+        "percentile": data["temperature"] > by_city.transform(lambda x: x.quantile(0.9)),
+        "global": (data["temperature"] - by_city.transform("mean")).abs() > 2 * by_city.transform("std"),
+    }
+    q1 = by_city.transform(lambda x: x.rolling(30, min_periods=1).quantile(0.25))
+    q3 = by_city.transform(lambda x: x.rolling(30, min_periods=1).quantile(0.75))
+    expected["iqr"] = (data["temperature"] < q1 - 1.5 * (q3 - q1)) | (data["temperature"] > q3 + 1.5 * (q3 - q1))
+    seasonal = data.groupby(["city", "season"])["temperature"]
+    expected["seasonal"] = (data["temperature"] - seasonal.transform("mean")).abs() > 2 * seasonal.transform("std")
+
+    for method, reference in expected.items():
+        flags = flag_anomalies(data, method=method)
+        pd.testing.assert_series_equal(flags, reference.rename("is_anomaly"), check_names=True, obj=method)
+        assert flags[10] and (flags[900] or method == "percentile")
+
+
+def test_utils_detect_anomalies_groups_by_season_only():
+    from app import utils
+
+    data = pd.DataFrame({"season": ["winter"] * 5 + ["summer"] * 5,
+                         "temperature": [0.0, 1.0, -1.0, 0.5, 30.0, 20.0, 21.0, 19.0, 20.5, 20.0]})
+    result = utils.detect_anomalies(data.copy(), std_dev_factor=1.5)
+    assert {"mean", "std", "anomaly"} <= set(result.columns)
+    assert result["anomaly"].tolist() == [False] * 4 + [True] + [False] * 5
+
+
+def test_rolling_quantiles_match_naive_window():
+    data = generate_temperature_data(n_cities=3, n_years=1, seed=2)
+    data.loc[[5, 400], "temperature"] = np.nan
+    codes, _ = pd.factorize(data["city"])
+    order, starts, ends = group_bounds(codes)
+    values = data["temperature"].to_numpy()[order]
+
+    median = rolling_quantile(values, starts, ends, 0.5, window=7)
+    naive = [np.nanmedian(values[max(start, i - 6):i + 1]) if not np.isnan(values[max(start, i - 6):i + 1]).all()
+             else np.nan for start, end in zip(starts, ends) for i in range(start, end)]
+    np.testing.assert_allclose(median, naive)
+
+    city_data = data[data["city"] == "London"].reset_index(drop=True)
+    bands = calculate_rolling_quantiles(city_data, window=7)
+    assert list(bands.columns) == ["rolling_q1", "rolling_median", "rolling_q3"]
+    assert (bands["rolling_q1"] <= bands["rolling_median"]).all()
+    assert (bands["rolling_median"] <= bands["rolling_q3"]).all()
+    figure = moving_average_figure(city_data, "London", window=7)
+    assert [trace.name for trace in figure.data] == ["Q3", "Q1 – Q3", "Медиана", "Среднее"]
+
+
+def test_dataset_registry_shares_copies_and_evicts_unused(tmp_path, sample_data):
+    registry = DatasetRegistry(max_bytes=10 ** 9)
+    first, second = UserSession(registry), UserSession(registry)
+    first.df = sample_data
+    second.df = sample_data.copy()
+    assert first.df is second.df and len(registry) == 1 and registry.handles == 2
+
+    path = tmp_path / "upload.csv"
+    sample_data.to_csv(path, index=False)
+    calls = []
+    loader = lambda source: calls.append(source) or load_dataset(source, name="upload.csv")
+    with open(path, "rb") as source:
+        loaded = registry.load(source, loader)
+    with open(path, "rb") as source:
+        assert registry.load(source, loader) is loaded and len(calls) == 1
+
+    other = sample_data.assign(temperature=sample_data["temperature"] + 1)
+    second.df = other
+    registry.max_bytes = 0
+    registry.register(other)
+    assert first.df is not None and second.df is other
+    del first.df
+    assert len(registry) == 1 and registry.handles == 1
+    assert not hasattr(UserSession(registry), "df")
+
+
+def test_dataset_store_reopens_memory_mapped_dataset(tmp_path):
+    df = generate_temperature_data(n_cities=3, n_years=1, seed=4).pipe(optimize_dtypes)
+    source = tmp_path / "upload.parquet"
+    df.to_parquet(source, index=False)
+
+    registry = DatasetRegistry(max_bytes=10 ** 9, store=DatasetStore(tmp_path / "store"))
+    with open(source, "rb") as upload:
+        loaded = registry.load(upload, lambda upload: load_dataset(upload, name="upload.parquet"))
+    key = fingerprint(loaded)
+    registry.save_analysis(key, analyze_cities(loaded))
+    pd.testing.assert_frame_equal(loaded, df)
+    assert isinstance(loaded["temperature"].to_numpy().base, np.memmap)
+
+    result_cache.clear()
+    restarted = DatasetRegistry(max_bytes=10 ** 9, store=DatasetStore(tmp_path / "store"))
+    calls = []
+    with open(source, "rb") as upload:
+        reopened = restarted.load(upload, lambda upload: calls.append(upload))
+    assert not calls and fingerprint(reopened) == key
+    pd.testing.assert_frame_equal(reopened, df)
+    assert ("seasonal_baseline", key) in result_cache
+    analysis = result_cache.get(("analyze_cities", key))
+    pd.testing.assert_frame_equal(analysis.city("Paris"), analyze_cities(df).city("Paris"))
+
+
+def test_dataset_store_records_sources_and_evicts_least_recently_used(tmp_path):
+    frames = [generate_temperature_data(n_cities=2, n_years=1, seed=seed).pipe(optimize_dtypes) for seed in range(3)]
+    store = DatasetStore(tmp_path / "store")
+    store.save(frames[0], "first", source="a")
+    store.save(frames[0], "first", source="b")
+    assert store.info("first")["sources"] == ["a", "b"] and store.find("b") == "first"
+
+    store.max_bytes = int(_disk_bytes(tmp_path / "store" / "first") * 2.5)
+    store.save(frames[1], "second")
+    store.open("first")
+    store.save(frames[2], "third")
+    assert store.keys() == ["first", "third"]
+
+
+def test_parquet_download_is_built_only_on_request(monkeypatch, sample_data):
+    from app.pages import data_upload
+
+    built, offered, clicked = [], [], []
+    monkeypatch.setattr(data_upload, "to_parquet_bytes", lambda df: built.append(len(df)) or b"parquet")
+    monkeypatch.setattr(data_upload.st, "button", lambda *args, **kwargs: bool(clicked))
+    monkeypatch.setattr(data_upload.st, "download_button", lambda *args, data, **kwargs: offered.append(data))
+
+    session = UserSession()
+    data_upload.download_parquet(session, sample_data, "upload.csv")
+    assert not built and not offered
+    clicked.append(True)
+    data_upload.download_parquet(session, sample_data, "upload.csv")
+    clicked.clear()
+    data_upload.download_parquet(session, sample_data, "upload.csv")
+    assert built == [len(sample_data)] and offered == [b"parquet", b"parquet"]
+
+
+def test_stored_datasets_are_listed_only_for_their_owner(tmp_path, monkeypatch):
+    from app.pages import data_upload
+
+    df = generate_temperature_data(n_cities=2, n_years=1, seed=1).pipe(optimize_dtypes)
+    DatasetStore(tmp_path / "store").save(df, fingerprint(df), name="upload.csv")
+    DatasetRegistry(max_bytes=10 ** 9, store=DatasetStore(tmp_path / "store")).claim(fingerprint(df), "alice")
+
+    restarted = DatasetRegistry(max_bytes=10 ** 9, store=DatasetStore(tmp_path / "store"))
+    monkeypatch.setattr(data_upload, "datasets", restarted)
+    options = []
+    monkeypatch.setattr(data_upload.st, "selectbox", lambda label, keys, **kwargs: options.append(keys))
+
+    session = UserSession()
+    session.owner = "bob"
+    assert data_upload.select_stored_dataset(session) is None and not options
+    session.owner = "alice"
+    data_upload.select_stored_dataset(session)
+    assert options == [[None, fingerprint(df)]] and len(restarted) == 0
+
+
+def test_frame_codec_round_trips_missing_values_and_extension_dtypes(tmp_path):
+    df = pd.DataFrame({
+        "city": ["Paris", np.nan, "Berlin", "Paris"],
+        "station": pd.array(["A1", None, "B2", "A1"], dtype="string"),
+        "season": pd.Categorical(["winter", None, "summer", "winter"]),
+        "timestamp": pd.to_datetime(["2020-01-01", None, "2020-06-01", "2021-01-01"]).tz_localize("Europe/Paris"),
+        "temperature": [1.5, np.nan, 20.0, 2.5],
+    })
+    write_frame(tmp_path / "frame", df)
+    restored = read_frame(tmp_path / "frame")
+    pd.testing.assert_frame_equal(restored, df)
+    assert restored["city"].isna().tolist() == [False, True, False, False]
+
+
+def test_dataset_registry_keeps_upload_in_memory_when_store_is_unwritable(tmp_path, sample_data, caplog):
+    (tmp_path / "occupied").write_text("")
+    registry = DatasetRegistry(max_bytes=10 ** 9, store=DatasetStore(tmp_path / "occupied" / "datasets"))
+    path = tmp_path / "upload.csv"
+    sample_data.to_csv(path, index=False)
+    with caplog.at_level(logging.WARNING, logger="app.datasets"), open(path, "rb") as source:
+        loaded = registry.load(source, lambda source: load_dataset(source, name="upload.csv"))
+    assert fingerprint(loaded) in registry and registry.store.keys() == []
+    assert "не сохранен" in caplog.text
+
+
+def test_cold_start_skips_heavy_imports(tmp_path):
+    root = Path(__file__).resolve().parent.parent
+    script = (
+        "import sys, main\n"
+        "from app.lazy import load, import_report\n"
+        "load(main.PAGES['📁 Загрузка данных'])\n"
+        "print(sorted(m for m in ('plotly.express', 'scipy.stats', 'aiohttp') if m in sys.modules))\n"
+        "print(sorted(import_report()['module']))\n"
+    )
+    output = subprocess.run([sys.executable, "-c", script], cwd=tmp_path, env={**os.environ, "PYTHONPATH": str(root)},
+                            capture_output=True, text=True, check=True).stdout.splitlines()
+    assert output == ["[]", "['app.pages.data_upload', 'main']"]
+
+
+def test_moment_statistics_match_describe_and_scipy():
+    from scipy.stats import kurtosis, skew
+
+    data = generate_temperature_data(n_cities=3, n_years=2, seed=6)
+    data.loc[[7, 800], "temperature"] = np.nan
+    for by in (["city"], ["city", "season"]):
+        summary = moment_statistics.uncached(data, by=tuple(by))
+        grouped = data.dropna(subset=["temperature"]).groupby(by)["temperature"]
+        expected = grouped.describe().rename(columns={"25%": "q1", "50%": "median", "75%": "q3"})
+        expected["skewness"] = grouped.apply(skew)
+        expected["kurtosis"] = grouped.apply(kurtosis)
+        pd.testing.assert_frame_equal(summary.set_index(by)[expected.columns], expected, check_dtype=False)
+
+    city_data = data[data["city"] == "Paris"]
+    row = city_statistics(city_data)
+    assert row["count"] == city_data["temperature"].count()
+    assert row["skewness"] == pytest.approx(skew(city_data["temperature"].dropna()))
+
+
+def test_temperature_trends_match_per_city_regression():
+    from scipy.stats import linregress, t
+
+    data = generate_temperature_data(n_cities=4, n_years=8, seed=7)
+    data["temperature"] += np.where(data["city"] == "Tokyo", 0.2 * (data["timestamp"].dt.year - 2010), 0.0)
+    data = data[~((data["city"] == "Paris") & (data["timestamp"].dt.year == 2013))]
+
+    trends = temperature_trends.uncached(data).set_index("city")
+    means = period_means.uncached(data)
+    for city, group in means.groupby("city"):
+        fit = linregress(group["period"].dt.year, group["temperature"])
+        margin = t.ppf(0.975, len(group) - 2) * fit.stderr
+        expected = [len(group), fit.slope * 10, (fit.slope - margin) * 10, (fit.slope + margin) * 10]
+        np.testing.assert_allclose(trends.loc[city, ["periods", "slope", "ci_low", "ci_high"]].astype(float), expected)
+    assert trends.loc["Paris", "periods"] == 7
+    assert trends["slope"].idxmax() == "Tokyo" and trends.loc["Tokyo", "ci_low"] > 0